@@ -0,0 +1,137 @@
+"""
+Evaluate many positions at once with NumPy, for offline work like eval tuning and game analysis where scoring positions
+one by one in Python is too slow. Positions are stored as an (N, 64) int8 array of piece codes, square row * 8 + col,
+0 for an empty square and 1 to 12 for the pieces in PIECES order. toPlanes and fromPlanes convert to and from the
+(N, 12, 8, 8) one-hot layout, one 8x8 plane per piece, which every function here accepts as well.
+Scores are the same as GameState.getEvaluation and SmartMoveFinder.scoreMaterial give, from white's point of view.
+NumPy is only needed for this module: pip install numpy
+Run this file directly to check the batch scores against GameState and compare the speed.
+"""
+
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:  # the game and the search don't need numpy
+    np = None
+
+import ChessEngine
+import SmartMoveFinder
+from PieceSquareTables import MG_SCORES, EG_SCORES, PHASE_WEIGHTS, TOTAL_PHASE
+
+PIECES = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PIECE_CODES = {piece: code for code, piece in enumerate(('--',) + PIECES)}
+
+if np is not None:
+    # score of every piece code on every square, row 0 is the empty square
+    MG_TABLE = np.array([[0] * 64] + [MG_SCORES[piece] for piece in PIECES], dtype=np.int32)
+    EG_TABLE = np.array([[0] * 64] + [EG_SCORES[piece] for piece in PIECES], dtype=np.int32)
+    PHASE_TABLE = np.array([0] + [PHASE_WEIGHTS[piece[1]] for piece in PIECES], dtype=np.int32)
+    MATERIAL_TABLE = np.array([0] + [SmartMoveFinder.pieceScore[piece[1]] * (1 if piece[0] == 'w' else -1)
+                                     for piece in PIECES], dtype=np.int32)
+    SQUARES = np.arange(64)
+    PLANE_CODES = np.arange(1, len(PIECES) + 1, dtype=np.int8)
+
+
+def _requireNumpy():
+    if np is None:
+        raise ImportError("BatchEvaluation needs numpy, install it with: pip install numpy")
+
+
+"""
+(N, 64) int8 piece codes of a list of GameStates or 8x8 boards
+"""
+
+
+def encodeBoards(positions):
+    _requireNumpy()
+    codes = np.empty((len(positions), 64), dtype=np.int8)
+    for i, position in enumerate(positions):
+        board = position.board if isinstance(position, ChessEngine.GameState) else position
+        codes[i] = [PIECE_CODES[square] for row in board for square in row]
+    return codes
+
+
+def toPlanes(codes):
+    _requireNumpy()
+    codes = np.asarray(codes)
+    planes = codes[:, None, :] == PLANE_CODES[None, :, None]
+    return planes.astype(np.int8).reshape(len(codes), len(PIECES), 8, 8)
+
+
+def fromPlanes(planes):
+    _requireNumpy()
+    planes = np.asarray(planes).reshape(len(planes), len(PIECES), 64)
+    return (planes * PLANE_CODES[None, :, None]).sum(axis=1).astype(np.int8)
+
+
+"""
+Piece codes of any accepted input: GameStates, boards, an (N, 64) code array or an (N, 12, 8, 8) plane array
+"""
+
+
+def _codes(positions):
+    _requireNumpy()
+    if not isinstance(positions, np.ndarray):
+        return encodeBoards(positions)
+    if positions.ndim == 4:
+        return fromPlanes(positions)
+    return positions
+
+
+"""
+Tapered material plus piece-square score of every position, the same as GameState.getEvaluation
+"""
+
+
+def evaluateBatch(positions):
+    codes = _codes(positions).astype(np.intp)
+    mgScores = MG_TABLE[codes, SQUARES].sum(axis=1)
+    egScores = EG_TABLE[codes, SQUARES].sum(axis=1)
+    phases = np.minimum(PHASE_TABLE[codes].sum(axis=1), TOTAL_PHASE)
+    return (mgScores * phases + egScores * (TOTAL_PHASE - phases)) // TOTAL_PHASE
+
+
+"""
+Material only score of every position, the same as SmartMoveFinder.scoreMaterial
+"""
+
+
+def scoreMaterialBatch(positions):
+    return MATERIAL_TABLE[_codes(positions).astype(np.intp)].sum(axis=1)
+
+
+def randomPositions(count, seed=1, maxPlies=120):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        gs = ChessEngine.GameState()
+        for _ in range(rng.randrange(maxPlies)):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+        positions.append(gs)
+    return positions
+
+
+if __name__ == "__main__":
+    positions = randomPositions(2000)
+    start = time.perf_counter()
+    for gs in positions:  # scoring from scratch one position at a time
+        gs.computeEvaluation()
+    loopTime = time.perf_counter() - start
+    expected = [gs.getEvaluation() for gs in positions]
+    codes = encodeBoards(positions)
+    start = time.perf_counter()
+    scores = evaluateBatch(codes)
+    batchTime = time.perf_counter() - start
+    mismatches = sum(int(a != b) for a, b in zip(scores, expected))
+    mismatches += sum(int(a != b) for a, b in zip(evaluateBatch(toPlanes(codes)), expected))
+    mismatches += sum(int(a != SmartMoveFinder.scoreMaterial(gs.board))
+                      for a, gs in zip(scoreMaterialBatch(codes), positions))
+    print("positions:", len(positions), "mismatches:", mismatches)
+    print("python loop: %.3fs  %.0f positions/s" % (loopTime, len(positions) / loopTime))
+    print("numpy batch: %.3fs  %.0f positions/s" % (batchTime, len(positions) / batchTime))
+    print("speedup: %.1fx" % (loopTime / batchTime))
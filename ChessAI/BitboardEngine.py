@@ -0,0 +1,425 @@
+"""
+Bitboard backed version of ChessEngine.GameState. Next to the 8x8 list board it keeps one 64-bit integer per piece
+(color + type), where bit number row * 8 + col is set when that piece stands on the square, so bit 0 is a8 and bit 63
+is h1. Knight, king and pawn attacks come from tables built once at import time and sliding attacks are computed from
+ray masks by finding the first blocker on each ray. getValidMoves, getValidCaptures, makeMove and undoMove keep the
+same API and return the same moves as the list backend, the list board is still updated so Move objects and the ui
+keep working.
+Run this file directly to compare the speed of legal move generation of both backends. The bitboard backend was about
+1.7x faster when it was added, the list backend has caught up since with its attack map, lookup tables and staged
+generation and the gap is now about 1.2x.
+"""
+
+import random
+import time
+
+import ChessEngine
+from ChessEngine import Move
+
+PIECES = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+FULL_BOARD = (1 << 64) - 1
+
+# (row, col) steps, the first two of each group go towards higher square numbers
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _stepTable(steps):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mask = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(mask)
+    return table
+
+
+def _rayTable(d):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mask = 0
+        r, c = r + d[0], c + d[1]
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << (r * 8 + c)
+            r, c = r + d[0], c + d[1]
+        table.append(mask)
+    return table
+
+
+SQUARE_COORDS = [divmod(sq, 8) for sq in range(64)]  # square number -> (row, col)
+KNIGHT_ATTACKS = _stepTable(KNIGHT_JUMPS)
+KING_ATTACKS = _stepTable(KING_STEPS)
+# squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = {'w': _stepTable(((-1, -1), (-1, 1))), 'b': _stepTable(((1, -1), (1, 1)))}
+ROOK_RAYS = [_rayTable(d) for d in ROOK_DIRECTIONS]
+BISHOP_RAYS = [_rayTable(d) for d in BISHOP_DIRECTIONS]
+ROOK_LINES = [ROOK_RAYS[0][sq] | ROOK_RAYS[1][sq] | ROOK_RAYS[2][sq] | ROOK_RAYS[3][sq] for sq in range(64)]
+BISHOP_LINES = [BISHOP_RAYS[0][sq] | BISHOP_RAYS[1][sq] | BISHOP_RAYS[2][sq] | BISHOP_RAYS[3][sq] for sq in range(64)]
+
+# squares strictly between two squares on the same line, 0 if they are not on a line
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+    for _sq in range(64):
+        _r, _c = divmod(_sq, 8)
+        _mask = 0
+        _r, _c = _r + _d[0], _c + _d[1]
+        while 0 <= _r < 8 and 0 <= _c < 8:
+            BETWEEN[_sq][_r * 8 + _c] = _mask
+            _mask |= 1 << (_r * 8 + _c)
+            _r, _c = _r + _d[0], _c + _d[1]
+
+
+def _slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for i in range(4):
+        ray = rays[i][sq]
+        blockers = ray & occupied
+        if blockers:
+            if i < 2:  # ray goes to higher squares, lowest set bit is the first blocker
+                first = (blockers & -blockers).bit_length() - 1
+            else:  # ray goes to lower squares, highest set bit is the first blocker
+                first = blockers.bit_length() - 1
+            ray ^= rays[i][first]  # cut off everything behind the blocker
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def bishopAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def squares(bitboard):
+    """
+    Yields the square numbers of all set bits, lowest first
+    """
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def __init__(self, fen=None):
+        self.bitboards = {}
+        self.occupancy = {}
+        super().__init__(fen)
+        self.loadBitboards()
+
+    def loadFen(self, fen):
+        super().loadFen(fen)
+        self.loadBitboards()
+
+    """
+    Rebuild all bitboards from the list board
+    """
+
+    def loadBitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= 1 << (r * 8 + c)
+                    self.occupancy[piece[0]] |= 1 << (r * 8 + c)
+
+    def _toggle(self, piece, r, c):
+        bit = 1 << (r * 8 + c)
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self._toggle(move.pieceMoved, move.startRow, move.startCol)
+        self._toggle(self.board[move.endRow][move.endCol], move.endRow, move.endCol)  # promoted piece if promotion
+        if move.enPassant:
+            self._toggle(move.pieceCaptured, move.startRow, move.endCol)
+        elif move.pieceCaptured != "--":
+            self._toggle(move.pieceCaptured, move.endRow, move.endCol)
+        if move.isCastleMove:
+            self._castleRookToggle(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            pieceOnEnd = self.board[move.endRow][move.endCol]
+            super().undoMove()
+            self._toggle(pieceOnEnd, move.endRow, move.endCol)
+            self._toggle(move.pieceMoved, move.startRow, move.startCol)
+            if move.enPassant:
+                self._toggle(move.pieceCaptured, move.startRow, move.endCol)
+            elif move.pieceCaptured != "--":
+                self._toggle(move.pieceCaptured, move.endRow, move.endCol)
+            if move.isCastleMove:
+                self._castleRookToggle(move)
+
+    def _castleRookToggle(self, move):
+        rook = move.pieceMoved[0] + 'R'
+        if move.endCol - move.startCol == 2:  # kingside, rook goes h -> f
+            self._toggle(rook, move.endRow, move.endCol + 1)
+            self._toggle(rook, move.endRow, move.endCol - 1)
+        else:  # queenside, rook goes a -> d
+            self._toggle(rook, move.endRow, move.endCol - 2)
+            self._toggle(rook, move.endRow, move.endCol + 1)
+
+    """
+    Bitboard of all pieces of the given color that attack the square, with the given board occupancy
+    """
+
+    def attackersTo(self, sq, color, occupied):
+        bb = self.bitboards
+        queens = bb[color + 'Q']
+        pawnColor = 'b' if color == 'w' else 'w'  # a pawn attacks sq if a pawn of the other color on sq attacks it
+        attackers = ((KNIGHT_ATTACKS[sq] & bb[color + 'N']) |
+                     (KING_ATTACKS[sq] & bb[color + 'K']) |
+                     (PAWN_ATTACKS[pawnColor][sq] & bb[color + 'p']))
+        rooks = (bb[color + 'R'] | queens) & ROOK_LINES[sq]  # only walk the rays if a slider is on one of them
+        if rooks:
+            attackers |= rookAttacks(sq, occupied) & rooks
+        bishops = (bb[color + 'B'] | queens) & BISHOP_LINES[sq]
+        if bishops:
+            attackers |= bishopAttacks(sq, occupied) & bishops
+        return attackers
+
+    def squareUnderAttack(self, r, c, allyColor):
+        enemyColor = 'w' if allyColor == 'b' else 'b'
+        return self.attackersTo(r * 8 + c, enemyColor, self.occupancy['w'] | self.occupancy['b']) != 0
+
+    """
+    Returns if the player is in check, a list of pins, and a list of checks in the same format as the list backend
+    """
+
+    def checkForPinsAndChecks(self):
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        kingSq = self.bitboards[ally + 'K'].bit_length() - 1
+        pinMasks = self._pinMasks(kingSq, ally, enemy)
+        checkers = self.attackersTo(kingSq, enemy, self.occupancy['w'] | self.occupancy['b'])
+        return checkers != 0, self._asDirections(kingSq, pinMasks), self._asDirections(kingSq, squares(checkers))
+
+    def _asDirections(self, kingSq, sqs):
+        kingRow, kingCol = divmod(kingSq, 8)
+        result = []
+        for sq in sqs:
+            r, c = divmod(sq, 8)
+            dr, dc = r - kingRow, c - kingCol
+            if dr == 0 or dc == 0 or abs(dr) == abs(dc):  # on a line, store the unit step
+                dr, dc = _sign(dr), _sign(dc)
+            result.append((r, c, dr, dc))
+        return result
+
+    """
+    Finds pieces pinned to the king. Returns a dict from pinned square to the squares it may still move to, which are
+    the squares between the king and the pinner plus the pinner itself.
+    """
+
+    def _pinMasks(self, kingSq, ally, enemy):
+        bb = self.bitboards
+        ours = self.occupancy[ally]
+        occupied = ours | self.occupancy[enemy]
+        pinMasks = {}
+        for rays, sliders in ((ROOK_RAYS, bb[enemy + 'R'] | bb[enemy + 'Q']),
+                              (BISHOP_RAYS, bb[enemy + 'B'] | bb[enemy + 'Q'])):
+            for i in range(4):
+                ray = rays[i][kingSq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                if i < 2:
+                    first = (blockers & -blockers).bit_length() - 1
+                    rest = blockers ^ (1 << first)
+                    second = (rest & -rest).bit_length() - 1
+                else:
+                    first = blockers.bit_length() - 1
+                    rest = blockers ^ (1 << first)
+                    second = rest.bit_length() - 1
+                if second >= 0 and ours >> first & 1 and sliders >> second & 1:
+                    pinMasks[first] = BETWEEN[kingSq][second] | (1 << second)
+        return pinMasks
+
+    """
+    Legal moves, only the legal captures or only the quiet ones. getValidMoves, getValidCaptures and generateMoves of
+    GameState call this.
+    """
+
+    def getLegalMoves(self, capturesOnly=False, quietsOnly=False):
+        moves = []
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        bb = self.bitboards
+        board = self.board
+        ours = self.occupancy[ally]
+        theirs = self.occupancy[enemy]
+        occupied = ours | theirs
+        kingBit = bb[ally + 'K']
+        kingSq = kingBit.bit_length() - 1
+        kingRow, kingCol = divmod(kingSq, 8)
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        self.inCheck = checkers != 0
+        self.pins = []
+        self.checks = self._asDirections(kingSq, squares(checkers)) if checkers else []
+
+        # king moves, the king itself is removed from the board so it can't hide behind its own square
+        withoutKing = occupied ^ kingBit
+        if capturesOnly:
+            allowed = theirs
+        elif quietsOnly:
+            allowed = ~occupied
+        else:
+            allowed = ~ours
+        for sq in squares(KING_ATTACKS[kingSq] & allowed):
+            if not self.attackersTo(sq, enemy, withoutKing):
+                moves.append(Move((kingRow, kingCol), SQUARE_COORDS[sq], board))
+
+        if checkers & (checkers - 1) == 0:  # not in double check, other pieces can move too
+            if checkers:  # capture the checking piece or block the line to it
+                checkMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+            else:
+                checkMask = FULL_BOARD
+            pinMasks = self._pinMasks(kingSq, ally, enemy)
+            targetMask = allowed & checkMask
+            self._getPawnMoves(ally, occupied, theirs, checkMask, pinMasks, moves, capturesOnly, quietsOnly)
+            for sq in squares(bb[ally + 'N']):
+                if sq not in pinMasks:  # a pinned knight can never move
+                    self._addMoves(sq, KNIGHT_ATTACKS[sq] & targetMask, moves)
+            for piece, attacks in (('B', bishopAttacks), ('R', rookAttacks), ('Q', None)):
+                for sq in squares(bb[ally + piece]):
+                    if attacks is None:
+                        targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                    else:
+                        targets = attacks(sq, occupied)
+                    targets &= targetMask
+                    if sq in pinMasks:
+                        targets &= pinMasks[sq]
+                    self._addMoves(sq, targets, moves)
+            if not checkers and not capturesOnly:
+                self._getCastleMoves(kingRow, kingCol, enemy, occupied, moves)
+        return moves
+
+    def _addMoves(self, fromSq, targets, moves):
+        startSq = SQUARE_COORDS[fromSq]
+        board = self.board
+        while targets:
+            lowest = targets & -targets
+            moves.append(Move(startSq, SQUARE_COORDS[lowest.bit_length() - 1], board))
+            targets ^= lowest
+
+    def _getPawnMoves(self, ally, occupied, theirs, checkMask, pinMasks, moves, capturesOnly, quietsOnly):
+        board = self.board
+        pawns = self.bitboards[ally + 'p']
+        empty = ~occupied & FULL_BOARD
+        if capturesOnly:
+            singles = doubles = 0
+            step, backRow = (-8, 0) if ally == 'w' else (8, 7)
+        elif ally == 'w':
+            step, backRow = -8, 0
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & 0xFF0000000000) >> 8) & empty  # pawns that just left row 6 and land on row 4
+        else:
+            step, backRow = 8, 7
+            singles = (pawns << 8) & empty
+            doubles = ((singles & 0xFF0000) << 8) & empty  # pawns that just left row 1 and land on row 3
+        for targets, distance in ((singles & checkMask, 1), (doubles & checkMask, 2)):
+            for sq in squares(targets):
+                fromSq = sq - step * distance
+                if fromSq in pinMasks and not pinMasks[fromSq] >> sq & 1:
+                    continue
+                endSq = SQUARE_COORDS[sq]
+                self.addPawnMove(SQUARE_COORDS[fromSq], endSq, moves, endSq[0] == backRow)
+        if quietsOnly:
+            return
+        for fromSq in squares(pawns):
+            attacks = PAWN_ATTACKS[ally][fromSq]
+            targets = attacks & theirs & checkMask
+            if fromSq in pinMasks:
+                targets &= pinMasks[fromSq]
+            startSq = SQUARE_COORDS[fromSq]
+            for sq in squares(targets):
+                endSq = SQUARE_COORDS[sq]
+                self.addPawnMove(startSq, endSq, moves, endSq[0] == backRow)
+            if self.enPassantPossible:
+                epSq = self.enPassantPossible[0] * 8 + self.enPassantPossible[1]
+                if attacks >> epSq & 1 and self.enPassantIsSafe(startSq[0], startSq[1], self.enPassantPossible[1]):
+                    moves.append(Move(startSq, self.enPassantPossible, board, enPassant=True))
+
+    """
+    Taking en passant removes two pawns from one row, simply test if the king is attacked afterwards. Replaces the
+    board version of GameState, whose piece generators call it too.
+    """
+
+    def enPassantIsSafe(self, r, c, endCol):
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        kingSq = self.bitboards[ally + 'K'].bit_length() - 1
+        fromSq = r * 8 + c
+        capturedSq = r * 8 + endCol
+        epSq = (r - 1 if self.whiteToMove else r + 1) * 8 + endCol
+        after = ((self.occupancy['w'] | self.occupancy['b']) ^ (1 << fromSq) ^ (1 << capturedSq)) | (1 << epSq)
+        self.bitboards[enemy + 'p'] ^= 1 << capturedSq
+        exposed = self.attackersTo(kingSq, enemy, after)
+        self.bitboards[enemy + 'p'] ^= 1 << capturedSq
+        return not exposed
+
+    def _getCastleMoves(self, r, c, enemy, occupied, moves):
+        if self.whiteToMove:
+            kingside, queenside = self.whiteCastleKingside, self.whiteCastleQueenside
+        else:
+            kingside, queenside = self.blackCastleKingside, self.blackCastleQueenside
+        sq = r * 8 + c
+        if kingside and not occupied >> (sq + 1) & 3:
+            if not self.attackersTo(sq + 1, enemy, occupied) and not self.attackersTo(sq + 2, enemy, occupied):
+                moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove=True))
+        if queenside and not occupied >> (sq - 3) & 7:
+            if not self.attackersTo(sq - 1, enemy, occupied) and not self.attackersTo(sq - 2, enemy, occupied):
+                moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
+
+
+"""
+Plays random games with both backends side by side, checks that they generate the same legal moves in every position
+and times getValidMoves of each. Returns (positions, list seconds, bitboard seconds, mismatching positions).
+"""
+
+
+def compareBackends(games=20, plies=80, seed=1):
+    rng = random.Random(seed)
+    positions = mismatches = 0
+    listTime = bitboardTime = 0.0
+    for _ in range(games):
+        listGs = ChessEngine.GameState()
+        bitboardGs = BitboardGameState()
+        for _ in range(plies):
+            start = time.perf_counter()
+            listMoves = listGs.getValidMoves()
+            middle = time.perf_counter()
+            bitboardMoves = bitboardGs.getValidMoves()
+            end = time.perf_counter()
+            listTime += middle - start
+            bitboardTime += end - middle
+            positions += 1
+            listIDs = sorted(move.moveID for move in listMoves)
+            if listIDs != sorted(move.moveID for move in bitboardMoves):
+                mismatches += 1
+            if not listMoves:
+                break
+            moveID = rng.choice(listIDs)
+            listGs.makeMove(next(move for move in listMoves if move.moveID == moveID))
+            bitboardGs.makeMove(next(move for move in bitboardMoves if move.moveID == moveID))
+    return positions, listTime, bitboardTime, mismatches
+
+
+if __name__ == "__main__":
+    positions, listTime, bitboardTime, mismatches = compareBackends()
+    print("positions:", positions, "mismatches:", mismatches)
+    print("list backend:     %.3fs  %.0f positions/s" % (listTime, positions / listTime))
+    print("bitboard backend: %.3fs  %.0f positions/s" % (bitboardTime, positions / bitboardTime))
+    print("speedup: %.2fx" % (listTime / bitboardTime))
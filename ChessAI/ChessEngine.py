@@ -3,9 +3,56 @@ This class is responsible for storing all the information about the current stat
 responsible for determining the valid moves at the current state. It will also keep a move log.
 """
 
+import random
+
+from PieceSquareTables import MG_SCORES, EG_SCORES, PHASE_WEIGHTS, TOTAL_PHASE
+
+# Zobrist keys, one random 64-bit number per piece on each square, for the side to move, for every combination of
+# castle rights and for the en passant file. The generator is seeded so keys are the same in every run.
+_zobristRandom = random.Random(20210321)
+ZOBRIST_PIECES = {color + piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for color in "wb" for piece in "pRNBQK"}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+_zobristCastleRights = [_zobristRandom.getrandbits(64) for _ in range(4)]  # wks, wqs, bks, bqs
+ZOBRIST_CASTLING = []  # indexed by the 4 castle rights as bits
+for _rights in range(16):
+    _key = 0
+    for _i in range(4):
+        if _rights >> _i & 1:
+            _key ^= _zobristCastleRights[_i]
+    ZOBRIST_CASTLING.append(_key)
+ZOBRIST_EN_PASSANT_FILE = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))  # 4 orthogonal, then 4 diagonal
+ROOK_DIRECTIONS = DIRECTIONS[:4]
+BISHOP_DIRECTIONS = DIRECTIONS[4:]
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+# Lookup tables indexed by square (r * 8 + c), built once at import so the move generators and attack checks walk
+# ready-made (row, col) lists instead of doing offset arithmetic and bounds checks in their inner loops.
+# RAYS[sq] holds one ray per DIRECTIONS entry, the squares from next to sq out to the edge of the board.
+RAYS = [tuple(tuple((r + d[0] * i, c + d[1] * i) for i in range(1, 8) if _onBoard(r + d[0] * i, c + d[1] * i))
+              for d in DIRECTIONS) for r in range(8) for c in range(8)]
+ROOK_RAYS = [rays[:4] for rays in RAYS]
+BISHOP_RAYS = [rays[4:] for rays in RAYS]
+SLIDER_RAYS = {'R': ROOK_RAYS, 'B': BISHOP_RAYS, 'Q': RAYS}
+KNIGHT_TARGETS = [tuple((r + dr, c + dc) for dr, dc in KNIGHT_STEPS if _onBoard(r + dr, c + dc))
+                  for r in range(8) for c in range(8)]
+KING_TARGETS = [tuple((r + dr, c + dc) for dr, dc in KING_STEPS if _onBoard(r + dr, c + dc))
+                for r in range(8) for c in range(8)]
+
 
 class GameState:
-    def __init__(self):
+    def __init__(self, fen=None):
         # board is a 8x8 2d list, each element of the list has 2 characters.
         # The first character represents the color of
         # The second character represents the of the piece 'b' or w piece 'K'
@@ -34,6 +81,10 @@ class GameState:
         self.checkMate = False
         self.staleMate = False
         self.enPassantPossible = ()  # coordinates for the square where an en passant capture is possible
+        self.attackMap = None  # enemy attack counts per square, see getAttackMap
+        self.attackMapKey = None  # zobrist key of the position the attack map was built for
+        self.halfmoveClock = 0  # plies since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1  # starts at 1 and goes up after every black move
 
         # castling rights
         self.whiteCastleKingside = True
@@ -43,12 +94,198 @@ class GameState:
         self.castleRightsLog = [
             CastleRights(self.whiteCastleKingside, self.blackCastleKingside, self.whiteCastleQueenside,
                          self.blackCastleQueenside)]
+        self.enPassantPossibleLog = [self.enPassantPossible]
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.zobristLog = [self.computeZobristKey()]  # key of every position so far, the last one is the current
+        self.pawnKeyLog = [self.computePawnKey()]  # the same for the pawns alone, keys the pawn structure cache
+        # (middlegame score, endgame score, game phase) of every position so far, scores are from white's side
+        self.evaluationLog = [self.computeEvaluation()]
+        if fen is not None:
+            self.loadFen(fen)
+
+    """
+    64-bit Zobrist key of the current position, updated by makeMove and undoMove
+    """
+
+    @property
+    def zobristKey(self):
+        return self.zobristLog[-1]
+
+    """
+    Compute the Zobrist key from scratch by scanning the whole board
+    """
+
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castleRightsIndex()]
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT_FILE[self.enPassantPossible[1]]
+        return key
 
     """
-    Takes a Move as parameter and executes it (this will not work for castling, pawn promotion, and en-passant.
+    Zobrist key of the pawns alone, it only changes on pawn moves, pawn captures and promotions so positions that
+    differ in the pieces share their pawn structure evaluation
+    """
+
+    @property
+    def pawnKey(self):
+        return self.pawnKeyLog[-1]
+
+    def computePawnKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c][1] == 'p':
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+        return key
+
+    """
+    Material plus piece-square score in centipawns from white's point of view, blended from the middlegame and the
+    endgame score by how much material is left. Read in O(1) from the running sums kept by makeMove and undoMove.
+    """
+
+    def getEvaluation(self):
+        mgScore, egScore, phase = self.evaluationLog[-1]
+        phase = min(phase, TOTAL_PHASE)  # promotions can push the phase past the starting position
+        return (mgScore * phase + egScore * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+
+    """
+    Compute the (middlegame score, endgame score, game phase) sums from scratch by scanning the whole board
+    """
+
+    def computeEvaluation(self):
+        mgScore = egScore = phase = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    mgScore += MG_SCORES[piece][r * 8 + c]
+                    egScore += EG_SCORES[piece][r * 8 + c]
+                    phase += PHASE_WEIGHTS[piece[1]]
+        return mgScore, egScore, phase
+
+    """
+    The 4 castle rights packed into the bits of a number from 0 to 15
+    """
+
+    def castleRightsIndex(self):
+        return (self.whiteCastleKingside | self.whiteCastleQueenside << 1 |
+                self.blackCastleKingside << 2 | self.blackCastleQueenside << 3)
+
+    """
+    Set up the position described by a FEN string. Everything played before is forgotten. The two move counters may
+    be left out, as in EPD, they default to 0 and 1.
+    """
+
+    def loadFen(self, fen):
+        fields = fen.split()
+        rows = fields[0].split('/') if fields else []
+        if len(rows) != 8 or len(fields) < 4:
+            raise ValueError("not a FEN position: " + fen)
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("not a FEN position: " + fen)
+        board = []
+        for rowText in rows:
+            row = []
+            for ch in rowText:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch in "pnbrqkPNBRQK":
+                    row.append(('w' if ch.isupper() else 'b') + ('p' if ch in "pP" else ch.upper()))
+                else:
+                    raise ValueError("not a FEN position: " + fen)
+            if len(row) != 8:
+                raise ValueError("not a FEN position: " + fen)
+            board.append(row)
+        self.board = board
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wK':
+                    self.whiteKingLocation = (r, c)
+                elif board[r][c] == 'bK':
+                    self.blackKingLocation = (r, c)
+        self.whiteToMove = fields[1] == 'w'
+        self.whiteCastleKingside = 'K' in fields[2]
+        self.whiteCastleQueenside = 'Q' in fields[2]
+        self.blackCastleKingside = 'k' in fields[2]
+        self.blackCastleQueenside = 'q' in fields[2]
+        if fields[3] == '-':
+            self.enPassantPossible = ()
+        else:
+            self.enPassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkMate = False
+        self.staleMate = False
+        self.castleRightsLog = [
+            CastleRights(self.whiteCastleKingside, self.blackCastleKingside, self.whiteCastleQueenside,
+                         self.blackCastleQueenside)]
+        self.enPassantPossibleLog = [self.enPassantPossible]
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.zobristLog = [self.computeZobristKey()]
+        self.pawnKeyLog = [self.computePawnKey()]
+        self.evaluationLog = [self.computeEvaluation()]
+
+    """
+    FEN string of the current position with castle rights, en passant square and both move counters, loadFen reads it
+    back to the same position
+    """
+
+    def getFen(self):
+        rows = []
+        for row in self.board:
+            text = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = 'P' if square[1] == 'p' else square[1]
+                text += letter if square[0] == 'w' else letter.lower()
+            rows.append(text + (str(empty) if empty else ""))
+        castling = ("K" if self.whiteCastleKingside else "") + ("Q" if self.whiteCastleQueenside else "") + \
+                   ("k" if self.blackCastleKingside else "") + ("q" if self.blackCastleQueenside else "")
+        enPassant = Move.colsToFiles[self.enPassantPossible[1]] + Move.rowsToRanks[self.enPassantPossible[0]] \
+            if self.enPassantPossible else "-"
+        return "%s %s %s %s %d %d" % ("/".join(rows), "w" if self.whiteToMove else "b", castling or "-", enPassant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    """
+    Play a move on the board, castling, en passant and promotion to the move's promotionChoice included. The Zobrist
+    and pawn keys and the evaluation sums are updated incrementally and everything undoMove needs goes on the logs.
     """
 
     def makeMove(self, move):
+        key = self.zobristLog[-1] ^ ZOBRIST_BLACK_TO_MOVE  # the side to move always changes
+        key ^= ZOBRIST_CASTLING[self.castleRightsIndex()]  # take out the old castle rights and en passant file
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT_FILE[self.enPassantPossible[1]]
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        mgScore, egScore, phase = self.evaluationLog[-1]
+        mgScore -= MG_SCORES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        egScore -= EG_SCORES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.pieceCaptured != "--":
+            capturedRow = move.startRow if move.enPassant else move.endRow
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][capturedRow * 8 + move.endCol]
+            mgScore -= MG_SCORES[move.pieceCaptured][capturedRow * 8 + move.endCol]
+            egScore -= EG_SCORES[move.pieceCaptured][capturedRow * 8 + move.endCol]
+            phase -= PHASE_WEIGHTS[move.pieceCaptured[1]]
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.board[move.startRow][move.startCol] = "--"
         self.moveLog.append(move)  # log the move so we can undo later
@@ -64,14 +301,18 @@ class GameState:
             self.enPassantPossible = ((move.endRow + move.startRow) // 2, move.endCol)
         else:
             self.enPassantPossible = ()
+        self.enPassantPossibleLog.append(self.enPassantPossible)
+        self.halfmoveClock = 0 if move.pieceMoved[1] == 'p' or move.pieceCaptured != "--" else self.halfmoveClock + 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if self.whiteToMove:  # black just moved
+            self.fullmoveNumber += 1
 
         # if en passant move, must update the board to capture the pawn
         if move.enPassant:
             self.board[move.startRow][move.endCol] = "--"
         # if pawn promotion change piece
         if move.pawnPromotion:
-            promotedPiece = input("Promote to Q, R, B, or N:")  # we can make this part of the ui later
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
         # update castling rights - whenever it is a rook or a king move
         self.updateCastleRights(move)
@@ -81,12 +322,41 @@ class GameState:
 
         # castle move
         if move.isCastleMove:
+            rookKeys = ZOBRIST_PIECES[move.pieceMoved[0] + 'R']
             if move.endCol - move.startCol == 2:  # kingside castle move
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # moves the rook
                 self.board[move.endRow][move.endCol + 1] = "--"  # empty space where rook was
+                key ^= rookKeys[move.endRow * 8 + move.endCol + 1] ^ rookKeys[move.endRow * 8 + move.endCol - 1]
+                rookFrom, rookTo = move.endRow * 8 + move.endCol + 1, move.endRow * 8 + move.endCol - 1
             else:  # queenside castle move
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # moves the rook
                 self.board[move.endRow][move.endCol - 2] = "--"  # empty space where rook was
+                key ^= rookKeys[move.endRow * 8 + move.endCol - 2] ^ rookKeys[move.endRow * 8 + move.endCol + 1]
+                rookFrom, rookTo = move.endRow * 8 + move.endCol - 2, move.endRow * 8 + move.endCol + 1
+            rook = move.pieceMoved[0] + 'R'
+            mgScore += MG_SCORES[rook][rookTo] - MG_SCORES[rook][rookFrom]
+            egScore += EG_SCORES[rook][rookTo] - EG_SCORES[rook][rookFrom]
+
+        # put in the piece on its end square (the promoted piece if promoting) and the new castle rights and en passant
+        pieceOnEnd = self.board[move.endRow][move.endCol]
+        key ^= ZOBRIST_PIECES[pieceOnEnd][move.endRow * 8 + move.endCol]
+        key ^= ZOBRIST_CASTLING[self.castleRightsIndex()]
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT_FILE[self.enPassantPossible[1]]
+        self.zobristLog.append(key)
+        pawnKey = self.pawnKeyLog[-1]
+        if move.pieceMoved[1] == 'p':
+            pawnKey ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+            if not move.pawnPromotion:
+                pawnKey ^= ZOBRIST_PIECES[move.pieceMoved][move.endRow * 8 + move.endCol]
+        if move.pieceCaptured[1] == 'p':
+            pawnKey ^= ZOBRIST_PIECES[move.pieceCaptured][capturedRow * 8 + move.endCol]
+        self.pawnKeyLog.append(pawnKey)
+        mgScore += MG_SCORES[pieceOnEnd][move.endRow * 8 + move.endCol]
+        egScore += EG_SCORES[pieceOnEnd][move.endRow * 8 + move.endCol]
+        if move.pawnPromotion:
+            phase += PHASE_WEIGHTS[move.promotionChoice]
+        self.evaluationLog.append((mgScore, egScore, phase))
 
     """
     Undo last move
@@ -110,10 +380,16 @@ class GameState:
                 self.board[move.endRow][move.endCol] = "--"  # removes the pawn that was added in the wrong square
                 self.board[move.startRow][
                     move.endCol] = move.pieceCaptured  # puts the pawn back on the correct square it was captured from
-                self.enPassantPossible = (move.endRow, move.endCol)  # allow an en passant to happen on the next move
-            # undo a 2 square pawn advance
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enPassantPossible = ()
+            # en passant square is whatever it was before the move
+            self.enPassantPossibleLog.pop()
+            self.enPassantPossible = self.enPassantPossibleLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            if not self.whiteToMove:  # taking back a black move
+                self.fullmoveNumber -= 1
+            self.zobristLog.pop()  # the keys and the evaluation before the move are still in the logs
+            self.pawnKeyLog.pop()
+            self.evaluationLog.pop()
 
             # give back castle rights if move took them away
             self.castleRightsLog.pop()  # remove last moves updates
@@ -133,79 +409,209 @@ class GameState:
                     self.board[move.endRow][move.endCol + 1] = "--"
 
     """
-    All moves considering checks
+    Standard algebraic notation (Nf3, exd5, O-O, e8=Q+) of a legal move in the current position, before it is made.
+    The piece is disambiguated by file, rank or both when another piece of the same kind can go to the same square.
     """
 
-    def getValidMoves(self):
-        moves = []
-        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
-        if self.whiteToMove:
-            kingRow = self.whiteKingLocation[0]
-            kingCol = self.whiteKingLocation[1]
+    def getSAN(self, move):
+        if move.isCastleMove:
+            san = "O-O" if move.endCol > move.startCol else "O-O-O"
         else:
-            kingRow = self.blackKingLocation[0]
-            kingCol = self.blackKingLocation[1]
+            target = move.getRankFile(move.endRow, move.endCol)
+            capture = "x" if move.pieceCaptured != "--" else ""
+            if move.pieceMoved[1] == 'p':
+                san = (Move.colsToFiles[move.startCol] + capture if capture else "") + target
+                if move.pawnPromotion:
+                    san += "=" + move.promotionChoice
+            else:
+                rivals = [other for other in self.getLegalMoves() if other.pieceMoved == move.pieceMoved and
+                          (other.endRow, other.endCol) == (move.endRow, move.endCol) and
+                          (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+                disambiguation = ""
+                if rivals:
+                    if all(other.startCol != move.startCol for other in rivals):
+                        disambiguation = Move.colsToFiles[move.startCol]
+                    elif all(other.startRow != move.startRow for other in rivals):
+                        disambiguation = Move.rowsToRanks[move.startRow]
+                    else:
+                        disambiguation = move.getRankFile(move.startRow, move.startCol)
+                san = move.pieceMoved[1] + disambiguation + capture + target
+        state = (self.inCheck, self.pins, self.checks, self.checkMate, self.staleMate)
+        self.makeMove(move)
+        replies = self.getLegalMoves()
         if self.inCheck:
-            if len(self.checks) == 1:  # only 1 check, block check or move king
-                moves = self.getAllPossibleMoves()
-                # to block a check you must move a piece into one of the squares between the enemy piece and king
-                check = self.checks[0]
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]  # enemy piece causing the check
-                validSquares = []  # squares that pieces can move to
-                # if knight, must capture knight or move king, other pieces can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i,
-                                       kingCol + check[3] * i)  # check[2] and check[3] are the check directions
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:
-                            break
-                # get rid of any moves that don't block check or move king
-                # go through backwards when you are removing from a list as iterating
-                for i in range(len(moves) - 1, -1, -1):
-                    if moves[i].pieceMoved[1] != 'K':  # move doesn't move king, so it must block or capture
-                        if not (moves[i].endRow,
-                                moves[i].endCol) in validSquares:  # move doesn't block check or capture piece
-                            moves.remove(moves[i])
-            else:  # double check, king has to move
-                self.getKingMove(kingRow, kingCol, moves)
-        else:  # not in check so all moves are fine
-            moves = self.getAllPossibleMoves()
+            san += "+" if replies else "#"
+        self.undoMove()
+        self.inCheck, self.pins, self.checks, self.checkMate, self.staleMate = state
+        return san
+
+    """
+    All moves considering checks
+    """
+
+    def getValidMoves(self):
+        moves = self.getLegalMoves()
         if len(moves) == 0:
             if self.inCheck:
                 self.checkMate = True
-                print("CheckMate!!!")
             else:
                 self.staleMate = True
-                print("StaleMate!!!")
         else:
             self.checkMate = False
             self.staleMate = False
         return moves
 
+    """
+    All captures considering checks. Quiet moves are never generated, this is the path for the quiescence search.
+    """
+
+    def getValidCaptures(self):
+        return self.getLegalMoves(capturesOnly=True)
+
+    """
+    Legal moves, only the legal captures or only the legal quiet moves (everything that captures nothing, castling and
+    promotions without capture included). Doesn't touch the checkmate and stalemate flags.
+    """
+
+    def getLegalMoves(self, capturesOnly=False, quietsOnly=False):
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.inCheck:
+            return self.getCheckEvasions(capturesOnly, quietsOnly)
+        return self.getAllPossibleMoves(capturesOnly, quietsOnly)  # not in check so all moves are fine
+
+    """
+    Legal moves lazily, in stages: the hash move first if it is legal here, then the captures, then the quiet moves.
+    Every stage is only generated once the search asks for its first move, so a cutoff by the hash move or a capture
+    never pays for the quiet moves. order, if given, sorts each stage's list in place before it is handed out. In
+    check the stages hold the check evasions. Doesn't touch the checkmate and stalemate flags, when nothing is yielded
+    inCheck tells checkmate from stalemate.
+    """
+
+    def generateMoves(self, hashMoveID=None, order=None):
+        hashMove = self.getLegalMove(hashMoveID) if hashMoveID is not None else None
+        if hashMove is not None:
+            yield hashMove
+        for capturesOnly in (True, False):
+            moves = self.getLegalMoves(capturesOnly, not capturesOnly)  # the search may have moved on since the yield
+            if hashMove is not None:
+                moves = [move for move in moves if move.moveID != hashMove.moveID]
+            if order is not None:
+                order(moves)
+            yield from moves
+
+    """
+    The legal move with the given moveID, None if there is none, for instance a hash move from another position. Only
+    the moves of the piece on the start square are generated.
+    """
+
+    def getLegalMove(self, moveID):
+        r, c = divmod(moveID & 63, 8)
+        piece = self.board[r][c]
+        if piece[0] != ('w' if self.whiteToMove else 'b'):
+            return None
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.inCheck:
+            moves = self.getCheckEvasions()
+        else:
+            moves = []
+            self.moveFunctions[piece[1]](r, c, moves)
+        for move in moves:
+            if move.moveID == moveID:
+                return move
+        return None
+
+    """
+    Legal moves while in check, needs inCheck, pins and checks set. Against a single check only the moves that
+    capture the checking piece or block its line are generated, by looking outward from those few target squares for
+    pieces that reach them, pinned pieces can't help. In double check only the king moves.
+    """
+
+    def getCheckEvasions(self, capturesOnly=False, quietsOnly=False):
+        moves = []
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if len(self.checks) == 1:
+            checkRow, checkCol, checkDRow, checkDCol = self.checks[0]
+            pinned = {(pin[0], pin[1]) for pin in self.pins}
+            if not quietsOnly:
+                self.getMovesTo(checkRow, checkCol, pinned, moves)
+                self.getEnPassantEvasions(checkRow, checkCol, pinned, moves)
+            if not capturesOnly and self.board[checkRow][checkCol][1] != 'N':  # a knight's check can't be blocked
+                for r, c in RAYS[kingRow * 8 + kingCol][DIRECTIONS.index((checkDRow, checkDCol))]:
+                    if r == checkRow and c == checkCol:
+                        break
+                    self.getMovesTo(r, c, pinned, moves)
+        self.getKingMove(kingRow, kingCol, moves, capturesOnly, quietsOnly)
+        return moves
+
+    """
+    Add the moves of unpinned pieces other than the king that go to (r, c), a capture if an enemy piece stands there
+    """
+
+    def getMovesTo(self, r, c, pinned, moves):
+        board = self.board
+        allyColor = 'w' if self.whiteToMove else 'b'
+        for j, ray in enumerate(RAYS[r * 8 + c]):  # sliders, the first piece along each ray
+            for endRow, endCol in ray:
+                piece = board[endRow][endCol]
+                if piece == "--":
+                    continue
+                if piece[0] == allyColor and (endRow, endCol) not in pinned and \
+                        (piece[1] == 'Q' or piece[1] == ('R' if j < 4 else 'B')):
+                    moves.append(Move((endRow, endCol), (r, c), board))
+                break
+        for startRow, startCol in KNIGHT_TARGETS[r * 8 + c]:
+            if board[startRow][startCol] == allyColor + 'N' and (startRow, startCol) not in pinned:
+                moves.append(Move((startRow, startCol), (r, c), board))
+        pawn = allyColor + 'p'
+        startRow = r + 1 if self.whiteToMove else r - 1  # the row a pawn steps to (r, c) from
+        if not 0 <= startRow < 8:
+            return
+        pawnPromotion = r == (0 if self.whiteToMove else 7)
+        if board[r][c] == "--":  # pawn pushes
+            if board[startRow][c] == pawn:
+                if (startRow, c) not in pinned:
+                    self.addPawnMove((startRow, c), (r, c), moves, pawnPromotion)
+            elif board[startRow][c] == "--" and r == (4 if self.whiteToMove else 3):  # 2 square move
+                fromRow = startRow + 1 if self.whiteToMove else startRow - 1
+                if board[fromRow][c] == pawn and (fromRow, c) not in pinned:
+                    moves.append(Move((fromRow, c), (r, c), board))
+        else:  # pawn captures
+            for startCol in (c - 1, c + 1):
+                if 0 <= startCol < 8 and board[startRow][startCol] == pawn and (startRow, startCol) not in pinned:
+                    self.addPawnMove((startRow, startCol), (r, c), moves, pawnPromotion)
+
+    """
+    Add en passant captures of the pawn on (r, c) if it is the pawn that just moved two squares
+    """
+
+    def getEnPassantEvasions(self, r, c, pinned, moves):
+        if not self.enPassantPossible or (r + (-1 if self.whiteToMove else 1), c) != self.enPassantPossible:
+            return
+        pawn = 'wp' if self.whiteToMove else 'bp'
+        for startCol in (c - 1, c + 1):
+            if 0 <= startCol < 8 and self.board[r][startCol] == pawn and (r, startCol) not in pinned and \
+                    self.enPassantIsSafe(r, startCol, c):
+                moves.append(Move((r, startCol), self.enPassantPossible, self.board, enPassant=True))
+
     """
     All the moves without considering checks
     """
 
-    def getAllPossibleMoves(self):
+    def getAllPossibleMoves(self, capturesOnly=False, quietsOnly=False):
         moves = []
         for r in range(len(self.board)):  # number of rows
             for c in range(len(self.board[r])):  # number of columns
                 turn = self.board[r][c][0]  # has either b or w or -
                 if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
                     piece = self.board[r][c][1]  # has name of piece
-                    self.moveFunctions[piece](r, c, moves)
+                    self.moveFunctions[piece](r, c, moves, capturesOnly, quietsOnly)
         return moves
 
     """
     Get all the pawn moves for the pawn located at row, col and add these moves to list
     """
 
-    def getPawnsMove(self, r, c, moves):
+    def getPawnsMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -225,36 +631,55 @@ class GameState:
             startRow = 1
             backRow = 7
             enemyColor = 'w'
-        pawnPromotion = False
-        if self.board[r + moveAmount][c] == "--":  # 1 square move
-            if not piecePinned or pinDirection == (moveAmount, 0):
-                if r + moveAmount == backRow:  # if piece gets to back rank then it is a pawn promotion
-                    pawnPromotion = True
-                moves.append(Move((r, c), (r + moveAmount, c), self.board, pawnPromotion=pawnPromotion))
+        pawnPromotion = r + moveAmount == backRow  # if piece gets to back rank then it is a pawn promotion
+        if self.board[r + moveAmount][c] == "--" and not capturesOnly:  # 1 square move
+            if not piecePinned or pinDirection == (moveAmount, 0) or pinDirection == (-moveAmount, 0):
+                self.addPawnMove((r, c), (r + moveAmount, c), moves, pawnPromotion)
                 if r == startRow and self.board[r + 2 * moveAmount][c] == "--":  # 2 square moves
                     moves.append(Move((r, c), (r + 2 * moveAmount, c), self.board))
-        if c - 1 >= 0:  # capture to left
-            if not piecePinned or pinDirection == (moveAmount, -1):
-                if self.board[r + moveAmount][c - 1][0] == enemyColor:
-                    if r + moveAmount == backRow:  # if piece gets to back rank then it is a pawn promotion
-                        pawnPromotion = True
-                    moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, pawnPromotion=pawnPromotion))
-                if (r + moveAmount, c - 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, enPassant=True))
-        if c + 1 <= 7:  # capture to right
-            if not piecePinned or pinDirection == (moveAmount, 1):
-                if self.board[r + moveAmount][c + 1][0] == enemyColor:
-                    if r + moveAmount == backRow:  # if piece gets to back rank then it is a pawn promotion
-                        pawnPromotion = True
-                    moves.append(Move((r, c), (r + moveAmount, c + 1), self.board, pawnPromotion=pawnPromotion))
-                if (r + moveAmount, c + 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r + moveAmount, c + 1), self.board, enPassant=True))
+        if quietsOnly:
+            return
+        for d in (-1, 1):  # captures to the left and to the right
+            if 0 <= c + d <= 7:
+                if not piecePinned or pinDirection == (moveAmount, d):
+                    if self.board[r + moveAmount][c + d][0] == enemyColor:
+                        self.addPawnMove((r, c), (r + moveAmount, c + d), moves, pawnPromotion)
+                    if (r + moveAmount, c + d) == self.enPassantPossible and self.enPassantIsSafe(r, c, c + d):
+                        moves.append(Move((r, c), (r + moveAmount, c + d), self.board, enPassant=True))
+
+    """
+    Add a pawn move, or one move for each piece the pawn can promote to
+    """
+
+    def addPawnMove(self, startSq, endSq, moves, pawnPromotion):
+        if pawnPromotion:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, pawnPromotion=True, promotionChoice=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
+    """
+    En passant takes two pawns off the same row at once, which the pin check can't see. Try it on the board and make
+    sure the king isn't attacked afterwards.
+    """
+
+    def enPassantIsSafe(self, r, c, endCol):
+        allyColor = 'w' if self.whiteToMove else 'b'
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        endRow = r - 1 if self.whiteToMove else r + 1
+        pawn, captured = self.board[r][c], self.board[r][endCol]
+        self.board[r][c] = self.board[r][endCol] = "--"
+        self.board[endRow][endCol] = pawn
+        safe = not self.squareUnderAttack(kingRow, kingCol, allyColor)
+        self.board[r][c], self.board[r][endCol] = pawn, captured
+        self.board[endRow][endCol] = "--"
+        return safe
 
     """
     Get all the rook moves for the rook located at row, col and add these moves to list
     """
 
-    def getRookMove(self, r, c, moves):
+    def getRookMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -265,52 +690,56 @@ class GameState:
                 if self.board[r][c][1] != 'Q':
                     self.pins.remove(self.pins[i])
                 break
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+        self.getSliderMoves(r, c, ROOK_DIRECTIONS, ROOK_RAYS[r * 8 + c], piecePinned, pinDirection, moves,
+                            capturesOnly, quietsOnly)
+
+    """
+    Add the moves along the rays of a rook, bishop or queen. A pinned piece only moves along the pin.
+    """
+
+    def getSliderMoves(self, r, c, directions, rays, piecePinned, pinDirection, moves, capturesOnly, quietsOnly):
+        board = self.board
         enemyColor = 'b' if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:  # on board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":  # empty space valid
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # enemy piece is valid
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:  # friendly piece invalid
-                            break
-                else:  # off board
+        for d, ray in zip(directions, rays):
+            if piecePinned and pinDirection != d and pinDirection != (-d[0], -d[1]):
+                continue
+            for endRow, endCol in ray:
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":  # empty space valid
+                    if not capturesOnly:
+                        moves.append(Move((r, c), (endRow, endCol), board))
+                elif endPiece[0] == enemyColor:  # enemy piece is valid
+                    if not quietsOnly:
+                        moves.append(Move((r, c), (endRow, endCol), board))
+                    break
+                else:  # friendly piece invalid
                     break
 
     """
     Get all the knight moves for the knight located at row, col and add these moves to list
     """
 
-    def getKnightMove(self, r, c, moves):
+    def getKnightMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
         piecePinned = False
         for i in range(len(self.pins) - 1, -1, -1):
             if self.pins[i][0] == r and self.pins[i][1] == c:
                 piecePinned = True
                 self.pins.remove(self.pins[i])
                 break
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        if piecePinned:  # a knight can't stay on the pin line
+            return
         allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor:  # not an ally piece (empty or enemy)
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+        for endRow, endCol in KNIGHT_TARGETS[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor:  # not an ally piece (empty or enemy)
+                if not (quietsOnly if endPiece != "--" else capturesOnly):
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """
     Get all the bishop moves for the bishop located at row, col and add these moves to list
     """
 
-    def getBishopMove(self, r, c, moves):
+    def getBishopMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -319,70 +748,43 @@ class GameState:
                 pinDirection = (self.pins[i][2], self.pins[i][3])
                 self.pins.remove(self.pins[i])
                 break
-        direction = ((-1, -1), (-1, 1), (1, -1), (1, 1))  # 4 diagonals
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in direction:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:  # on board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":  # empty space valid
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # enemy piece is valid
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:  # friendly piece invalid
-                            break
-                else:  # off board
-                    break
+        self.getSliderMoves(r, c, BISHOP_DIRECTIONS, BISHOP_RAYS[r * 8 + c], piecePinned, pinDirection, moves,
+                            capturesOnly, quietsOnly)
 
     """
     Get all the queen moves for the queen located at row, col and add these moves to list
     """
 
-    def getQueenMove(self, r, c, moves):
-        self.getRookMove(r, c, moves)
-        self.getBishopMove(r, c, moves)
+    def getQueenMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
+        self.getRookMove(r, c, moves, capturesOnly, quietsOnly)
+        self.getBishopMove(r, c, moves, capturesOnly, quietsOnly)
 
     """
     Get all the king moves for the king located at row, col and add these moves to list
     """
 
-    def getKingMove(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
+    def getKingMove(self, r, c, moves, capturesOnly=False, quietsOnly=False):
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[0]
-            endCol = c + colMoves[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # not an ally piece (empty or enemy)
-                    # place king on end square and check for checks
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    # place king back on original location
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
-        self.getCastleMoves(r, c, moves, allyColor)
+        attackMap = None  # only built once the king has a square to go to
+        for endRow, endCol in KING_TARGETS[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor and not (quietsOnly if endPiece != "--" else capturesOnly):  # empty or enemy
+                if attackMap is None:
+                    attackMap = self.getAttackMap()
+                if not attackMap[endRow * 8 + endCol]:  # the king can't step onto an attacked square
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
+        if not capturesOnly:
+            self.getCastleMoves(r, c, moves, allyColor)
 
     """
     Generate all valid castle moves for the king at (r,c) and add them to the list of moves
     """
 
     def getCastleMoves(self, r, c, moves, allyColor):
-        inCheck = self.squareUnderAttack(r, c, allyColor)
-        if inCheck:
-            print("oof")
+        if not ((self.whiteCastleKingside or self.whiteCastleQueenside) if self.whiteToMove else
+                (self.blackCastleKingside or self.blackCastleQueenside)):
+            return
+        if self.inCheck:
             return  # can't castle while we are in check
         if (self.whiteToMove and self.whiteCastleKingside) or (not self.whiteToMove and self.blackCastleKingside):
             self.getKingsideCastleMoves(r, c, moves, allyColor)
@@ -397,7 +799,8 @@ class GameState:
     def getKingsideCastleMoves(self, r, c, moves, allyColor):
         # check if two squares between king and rook are clear and not under attack
         if self.board[r][c + 1] == "--" and self.board[r][c + 2] == "--":
-            if not self.squareUnderAttack(r, c + 1, allyColor) and not self.squareUnderAttack(r, c + 2, allyColor):
+            attackMap = self.getAttackMap()
+            if not attackMap[r * 8 + c + 1] and not attackMap[r * 8 + c + 2]:
                 moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove=True))
 
     """
@@ -408,50 +811,94 @@ class GameState:
     def getQueensideCastleMoves(self, r, c, moves, allyColor):
         # check if three squares between king and rook are clear and two squares left of king are not under attack
         if self.board[r][c - 1] == "--" and self.board[r][c - 2] == "--" and self.board[r][c - 3] == "--":
-            if not self.squareUnderAttack(r, c - 1, allyColor) and not self.squareUnderAttack(r, c - 2, allyColor):
+            attackMap = self.getAttackMap()
+            if not attackMap[r * 8 + c - 1] and not attackMap[r * 8 + c - 2]:
                 moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
 
+    """
+    Number of enemy pieces attacking each square (r * 8 + c) in the current position, for king moves, castling and
+    checks. Sliders see through the king of the side to move, so the squares behind it along a checking line count as
+    attacked too. Built once per position, on first use, and reused until the position changes.
+    """
+
+    def getAttackMap(self):
+        key = self.zobristKey
+        if self.attackMapKey != key:
+            self.attackMap = self.computeAttackMap('b' if self.whiteToMove else 'w')
+            self.attackMapKey = key
+        return self.attackMap
+
+    """
+    Attack counts of the pieces of color on every square, with the other king taken off the board for the sliders
+    """
+
+    def computeAttackMap(self, color):
+        attacks = [0] * 64
+        board = self.board
+        transparentKing = "bK" if color == 'w' else "wK"
+        pawnStep = -1 if color == 'w' else 1
+        for r, row in enumerate(board):
+            for c, piece in enumerate(row):
+                if piece[0] != color:
+                    continue
+                kind = piece[1]
+                if kind == 'p':
+                    endSq = (r + pawnStep) * 8 + c
+                    if c > 0:
+                        attacks[endSq - 1] += 1
+                    if c < 7:
+                        attacks[endSq + 1] += 1
+                elif kind == 'N' or kind == 'K':
+                    for endRow, endCol in (KNIGHT_TARGETS if kind == 'N' else KING_TARGETS)[r * 8 + c]:
+                        attacks[endRow * 8 + endCol] += 1
+                else:
+                    for ray in SLIDER_RAYS[kind][r * 8 + c]:
+                        for endRow, endCol in ray:
+                            attacks[endRow * 8 + endCol] += 1
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "--" and endPiece != transparentKing:
+                                break
+        return attacks
+
+    """
+    Whether the side to move is in check, without generating moves or touching the pins and checks
+    """
+
+    def kingInCheck(self):
+        if self.whiteToMove:
+            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1], 'w')
+        return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1], 'b')
+
     def squareUnderAttack(self, r, c, allyColor):
         # check outward from square
         enemyColor = 'w' if allyColor == 'b' else 'b'
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor:  # no attak from that direction
-                        break
-                    elif endPiece[0] == enemyColor:
-                        typeOfPiece = endPiece[1]
-                        # 5 possibilities here in this complex conditional
-                        # 1.) orthogonally away from king and piece is a rook
-                        # 2.) diagonally away from king and piece is a bishop
-                        # 3.) 1 square away diagonally from king and piece is a pawn
-                        # 4.) any direction and piece is a queen
-                        # 5.) any direction 1 square away and piece is a king
-                        # (this is necessary to prevent a king move to a square controlled by another king)
-                        if (0 <= j <= 3 and typeOfPiece == "R") or \
-                                (4 <= j <= 7 and typeOfPiece == "B") or \
-                                (i == 1 and typeOfPiece == 'p' and
-                                 ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
-                                (typeOfPiece == "Q") or (i == 1 and typeOfPiece == "K"):
-                            return True
-                        else:  # enemy piece not applying check:
-                            break
-                else:
-                    break  # off board
-            # check for knight checks
-            knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-            for m in knightMoves:
-                endRow = r + m[0]
-                endCol = c + m[1]
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == enemyColor and endPiece[1] == "N":  # enemy knight attacking king
+        for j, ray in enumerate(RAYS[r * 8 + c]):
+            for i, (endRow, endCol) in enumerate(ray, 1):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor:  # no attak from that direction
+                    break
+                elif endPiece[0] == enemyColor:
+                    typeOfPiece = endPiece[1]
+                    # 5 possibilities here in this complex conditional
+                    # 1.) orthogonally away from king and piece is a rook
+                    # 2.) diagonally away from king and piece is a bishop
+                    # 3.) 1 square away diagonally from king and piece is a pawn
+                    # 4.) any direction and piece is a queen
+                    # 5.) any direction 1 square away and piece is a king
+                    # (this is necessary to prevent a king move to a square controlled by another king)
+                    if (0 <= j <= 3 and typeOfPiece == "R") or \
+                            (4 <= j <= 7 and typeOfPiece == "B") or \
+                            (i == 1 and typeOfPiece == 'p' and
+                             ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
+                            (typeOfPiece == "Q") or (i == 1 and typeOfPiece == "K"):
                         return True
+                    else:  # enemy piece not applying check:
+                        break
+        # check for knight checks
+        for endRow, endCol in KNIGHT_TARGETS[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] == enemyColor and endPiece[1] == "N":  # enemy knight attacking king
+                return True
         return False
 
     """
@@ -473,49 +920,44 @@ class GameState:
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
         # check outward from king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        for j, ray in enumerate(RAYS[startRow * 8 + startCol]):
+            d = DIRECTIONS[j]
             possiblePin = ()  # reset possible pins
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
-                        if possiblePin == ():  # 1st allied piece could be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else:  # 2nd allied piece, so no pin or check possible in this direction
-                            break
-                    elif endPiece[0] == enemyColor:
-                        typeOfPiece = endPiece[1]
-                        # 5 possibilities here in this complex conditional
-                        # 1.) orthogonally away from king and piece is a rook
-                        # 2.) diagonally away from king and piece is a bishop
-                        # 3.) 1 square away diagonally from king and piece is a pawn
-                        # 4.) any direction and piece is a queen
-                        # 5.) any direction 1 square away and piece is a king
-                        # (this is necessary to prevent a king move to a square controlled by another king)
-                        if (0 <= j <= 3 and typeOfPiece == "R") or \
-                                (4 <= j <= 7 and typeOfPiece == "B") or \
-                                (i == 1 and typeOfPiece == 'p' and
-                                 ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
-                                (typeOfPiece == "Q") or (i == 1 and typeOfPiece == "K"):
-                            if possiblePin == ():  # no piece blocking, so check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                            else:  # piece blocking so pin
-                                pins.append(possiblePin)
-            # check for knight checks
-            knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-            for m in knightMoves:
-                endRow = startRow + m[0]
-                endCol = startCol + m[1]
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == enemyColor and endPiece[1] == "N":  # enemy knight attacking king
-                        inCheck = True
-                        checks.append((endRow, endCol, m[0], m[1]))
+            for i, (endRow, endCol) in enumerate(ray, 1):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != 'K':
+                    if possiblePin == ():  # 1st allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else:  # 2nd allied piece, so no pin or check possible in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    typeOfPiece = endPiece[1]
+                    # 5 possibilities here in this complex conditional
+                    # 1.) orthogonally away from king and piece is a rook
+                    # 2.) diagonally away from king and piece is a bishop
+                    # 3.) 1 square away diagonally from king and piece is a pawn
+                    # 4.) any direction and piece is a queen
+                    # 5.) any direction 1 square away and piece is a king
+                    # (this is necessary to prevent a king move to a square controlled by another king)
+                    if (0 <= j <= 3 and typeOfPiece == "R") or \
+                            (4 <= j <= 7 and typeOfPiece == "B") or \
+                            (i == 1 and typeOfPiece == 'p' and
+                             ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
+                            (typeOfPiece == "Q") or (i == 1 and typeOfPiece == "K"):
+                        if possiblePin == ():  # no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else:  # piece blocking so pin
+                            pins.append(possiblePin)
+                        break
+                    else:  # enemy piece not applying check
+                        break
+        # check for knight checks
+        for endRow, endCol in KNIGHT_TARGETS[startRow * 8 + startCol]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] == enemyColor and endPiece[1] == "N":  # enemy knight attacking king
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
         return inCheck, pins, checks
 
     """
@@ -541,6 +983,17 @@ class GameState:
                     self.blackCastleQueenside = False
                 elif move.startCol == 7:  # right rook
                     self.blackCastleKingside = False
+        # a rook captured on its starting square can't castle anymore either
+        if move.pieceCaptured == "wR" and move.endRow == 7:
+            if move.endCol == 0:
+                self.whiteCastleQueenside = False
+            elif move.endCol == 7:
+                self.whiteCastleKingside = False
+        elif move.pieceCaptured == "bR" and move.endRow == 0:
+            if move.endCol == 0:
+                self.blackCastleQueenside = False
+            elif move.endCol == 7:
+                self.blackCastleKingside = False
 
 
 class CastleRights:
@@ -561,20 +1014,28 @@ class Move:
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, enPassant=False, pawnPromotion=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
+    # no per-move __dict__, the generators create one of these for every target square
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'enPassant',
+                 'pawnPromotion', 'promotionChoice', 'isCastleMove', 'moveID')
+
+    def __init__(self, startSq, endSq, board, enPassant=False, pawnPromotion=False, isCastleMove=False,
+                 promotionChoice='Q'):
+        self.startRow, self.startCol = startSq
+        self.endRow, self.endCol = endSq
         self.pieceMoved = board[self.startRow][self.startCol]
         self.pieceCaptured = board[self.endRow][self.endCol]
         self.enPassant = enPassant
         # castle move
         self.pawnPromotion = pawnPromotion
+        self.promotionChoice = promotionChoice  # piece the pawn turns into
         self.isCastleMove = isCastleMove
         if enPassant:
             self.pieceCaptured = 'bp' if self.pieceMoved == 'wp' else 'wp'  # enpassant captures opposite colored pawn
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        # packed as start square (bits 0-5), end square (bits 6-11) and promotion piece (bits 12-13), squares are
+        # row * 8 + col. A queen promotion packs as 0 so it keeps the plain id of a click on the same two squares.
+        self.moveID = self.startRow * 8 + self.startCol | (self.endRow * 8 + self.endCol) << 6
+        if pawnPromotion:
+            self.moveID |= PROMOTION_PIECES.index(promotionChoice) << 12
 
     """
     Overriding the equals method
@@ -585,12 +1046,18 @@ class Move:
             return self.moveID == other.moveID
         return False
 
-    def __str__(self):
+    def __hash__(self):
         return self.moveID
 
+    def __str__(self):
+        return self.getChessNotation()
+
     def getChessNotation(self):
         # add to make this like real chess notation
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.pawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -2,13 +2,21 @@
 this is our main driver file. It will be responsible for handling user input and displaying the current GameState
 """
 
+import os
+import time
+
 import pygame as p
-import ChessEngine, SmartMoveFinder
+import ChessEngine, SmartMoveFinder, EngineWorker, Tablebase
 
 WIDTH = HEIGHT = 512  # 400 is another option
 DIMENSION = 8  # dimensions of a chess board are 8x8
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15  # for animations later on
+MAX_FPS = 15  # frame rate while nothing moves
+ANIMATION_FPS = 60  # frame rate while a piece slides, the animation itself runs on time so any rate works
+ANIMATION_SECONDS_PER_SQUARE = 1 / 6  # 0 turns the animations off
+ANIMATION_SPEED_UP = 4  # 'f' plays the running animation this many times faster, space or a click skips it
+OPENING_BOOK = "book.bin"  # Polyglot opening book the AI plays from if the file exists
+PONDER = True  # let the AI think on the human's time about the reply it expects
 IMAGES = {}
 """ 
 Initialize a global dictionary of images. This will be called exactly once in the main 
@@ -32,9 +40,11 @@ def main():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
+    renderer = BoardRenderer(screen)
     gs = ChessEngine.GameState()
     moveMade = False  # flag variable for when a move is made
     animate = False  # flag variable for when we should animate a move
+    animation = None  # MoveAnimation of the last move while its piece slides, the main loop goes on meanwhile
     loadImages()
     running = True
     validMoves = gs.getValidMoves()
@@ -43,6 +53,17 @@ def main():
     gameOver = False
     playerOne = True  # If a Human is playing white, then this will be True. If an AI is playing, then it will be False
     playerTwo = False  # Same as above but for black
+    missing = Tablebase.missingTables()
+    if missing:
+        print("tablebases %s not found in %s, the AI plays those endgames by search. Generate them with: python "
+              "Tablebase.py" % (", ".join(missing), Tablebase.TABLE_DIR))
+    # the AI searches in this background process so the window stays responsive
+    worker = EngineWorker.EngineWorker(bookPath=OPENING_BOOK if os.path.isfile(OPENING_BOOK) else None,
+                                       tablebaseDir=Tablebase.TABLE_DIR if os.path.isdir(Tablebase.TABLE_DIR) else None)
+    aiThinking = False  # flag variable for when the worker is searching the current position
+    expectedReply = None  # the human move the AI expects after its last move, pondered on once validMoves are fresh
+    promotionChoices = []  # the promotion moves of the pawn the human moved, shown over the board until one is picked
+    humanMove = None
 
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
@@ -51,7 +72,14 @@ def main():
                 running = False
             # mouse handler
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver and humanTurn:
+                animation = None  # the piece jumps to its square, the click counts as usual
+                if promotionChoices:  # the click picks one of the pieces shown, anywhere else it cancels the promotion
+                    location = p.mouse.get_pos()
+                    for square, choice in promotionSquares(promotionChoices):
+                        if square == (location[1] // SQ_SIZE, location[0] // SQ_SIZE):
+                            humanMove = choice
+                    promotionChoices = []
+                elif not gameOver and humanTurn:
                     location = p.mouse.get_pos()  # get (x.y) location of mouse
                     col = location[0] // SQ_SIZE
                     row = location[1] // SQ_SIZE
@@ -65,150 +93,307 @@ def main():
                         move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
-                                print(move.getChessNotation())
-                                gs.makeMove(validMoves[i])
-                                moveMade = True
-                                animate = True
-                                sqSelected = ()
-                                playerClicks = []
-                        if not moveMade:
+                                if validMoves[i].pawnPromotion:  # the clicks match the queen promotion, show them all
+                                    promotionChoices = [validMove for validMove in validMoves
+                                                        if validMove.pawnPromotion and
+                                                        validMove.getChessNotation()[:4] == move.getChessNotation()]
+                                    sqSelected = ()
+                                    playerClicks = []
+                                else:
+                                    humanMove = validMoves[i]
+                        if humanMove is None and not promotionChoices:
                             playerClicks = [sqSelected]
+            # while the promotion pieces are shown q, r, b or n picks one, any other key cancels the promotion
+            elif e.type == p.KEYDOWN and promotionChoices:
+                for choice in promotionChoices:
+                    if e.unicode.upper() == choice.promotionChoice:
+                        humanMove = choice
+                promotionChoices = []
             # key handler
             elif e.type == p.KEYDOWN:
+                if e.key == p.K_SPACE:
+                    animation = None
+                if e.key == p.K_f and animation is not None:
+                    animation.speedUp(time.perf_counter(), ANIMATION_SPEED_UP)
                 if e.key == p.K_z:
+                    worker.cancel()  # the search or ponder search is for a position that is about to change
+                    aiThinking = False
+                    expectedReply = None
                     gs.undoMove()
                     moveMade = True
                     animate = False
+                    animation = None
                     gameOver = False
                 if e.key == p.K_r:  # reset the board when 'r' is pressed
+                    worker.cancel()
+                    aiThinking = False
+                    expectedReply = None
                     gs = ChessEngine.GameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
-
-        # AI move finder
-        if not gameOver and not humanTurn:
-            AIMove = SmartMoveFinder.findBestMove(gs, validMoves)
-            if AIMove == None:  # shouldn't access
-                AIMove = SmartMoveFinder.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            animate = True
+                    animation = None
+            if humanMove is not None:
+                print(humanMove.getChessNotation())
+                gs.makeMove(humanMove)
+                if PONDER:  # the ponder search answers at once if it expected this move
+                    aiThinking = worker.ponderHit(humanMove)
+                moveMade = True
+                animate = True
+                sqSelected = ()
+                playerClicks = []
+                humanMove = None
+
+        # AI move finder, validMoves are stale while moveMade so wait for the next frame then. The search starts
+        # while the last move is still sliding, its result waits in poll until the animation is over.
+        if not gameOver and not humanTurn and not moveMade:
+            if not aiThinking:
+                worker.startSearch(gs)
+                aiThinking = True
+            elif animation is None:
+                result = worker.poll()
+                if result is not None:
+                    aiThinking = False
+                    AIMove = None
+                    if result.move is not None:
+                        for move in validMoves:
+                            if move.moveID == result.move.moveID:
+                                AIMove = move
+                    if AIMove == None:  # shouldn't access
+                        AIMove = SmartMoveFinder.findRandomMove(validMoves)
+                    gs.makeMove(AIMove)
+                    if PONDER and AIMove == result.move and len(result.pv) > 1:
+                        expectedReply = result.pv[1]
+                    moveMade = True
+                    animate = True
 
         if moveMade:
-            if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+            animation = None  # a move made while another one slides ends that one
+            if animate and ANIMATION_SECONDS_PER_SQUARE > 0:
+                animation = MoveAnimation(gs.moveLog[-1], time.perf_counter())
             validMoves = gs.getValidMoves()
+            humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+            if expectedReply is not None and humanTurn:
+                for move in validMoves:
+                    if move.moveID == expectedReply.moveID:
+                        worker.startPonder(gs, move)
+            expectedReply = None
             moveMade = False
             animate = False
-        drawGameState(screen, gs, validMoves, sqSelected)
 
+        text = None
         if gs.checkMate:
             gameOver = True
             if gs.whiteToMove:
-                drawText(screen, 'Black wins by checkmate')
+                text = 'Black wins by checkmate'
             else:
-                drawText(screen, 'White wins by checkmate')
+                text = 'White wins by checkmate'
         elif gs.staleMate:
             gameOver = True
-            drawText(screen, 'Stalemate')
-        clock.tick(MAX_FPS)
-        p.display.flip()
+            text = 'Stalemate'
+        now = time.perf_counter()
+        if animation is not None and animation.done(now):
+            animation = None
+        # only what changed reaches the display
+        renderer.draw(gs, validMoves, sqSelected, text, animation, now, promotionChoices)
+        clock.tick(ANIMATION_FPS if animation is not None else MAX_FPS)
+    worker.close()
 
 
 """
-Highlight square selected and moves for piece selected
+Draws the game into the window, only redrawing what changed. The board squares are rendered once into a background
+surface. Every square remembers what it shows on screen (piece and highlight) and only squares whose content changed
+are drawn again and handed to display.update, so a frame where nothing happens costs a comparison of 64 pairs.
 """
 
 
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():  # didn't choose empty square
-        r, c = sqSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
-            # highlight selected square
+class BoardRenderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface((WIDTH, HEIGHT))  # the empty board
+        colors = [p.Color("white"), p.Color("gray")]
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                p.draw.rect(self.background, colors[(r + c) % 2], squareRect(r, c))
+        self.highlights = {}  # highlight name -> translucent square surface
+        for name, color in (("selected", "blue"), ("target", "yellow"), ("promotion", "green")):
             s = p.Surface((SQ_SIZE, SQ_SIZE))
             s.set_alpha(100)  # transparancy value -> 0 transparent; 255 opaque
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-            # highlight moves from that square
-            s.fill(p.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+            s.fill(p.Color(color))
+            self.highlights[name] = s
+        self.font = None  # created on first use, p.init() has to run first
+        self.textSurfaces = {}  # text -> (shadow surface, text surface, rect)
+        self.shown = [[None] * DIMENSION for _ in range(DIMENSION)]  # (piece, highlight) on screen, None if unknown
+        self.text = None  # text on screen
+        self.pieceRect = None  # where the animated piece was drawn over the squares
+        self.screen.blit(self.background, (0, 0))
+        p.display.flip()
+
+    """
+    Redraw the squares that changed since the last call and put text over the board, update only those rectangles.
+    While animation runs its end square shows what was there before the move and the piece is drawn where the
+    animation is at now. promotionChoices are shown as their pieces in a column from the promotion square.
+    """
+
+    def draw(self, gs, validMoves, sqSelected, text=None, animation=None, now=None, promotionChoices=()):
+        board = gs.board
+        highlights = squareHighlights(gs, validMoves, sqSelected)
+        if animation is not None:
+            move = animation.move
+            board = [row[:] for row in board]
+            board[move.endRow][move.endCol] = "--" if move.enPassant else move.pieceCaptured
+            highlights = {}
+        if promotionChoices:
+            board = [row[:] for row in board]
+            highlights = {}
+            for (r, c), choice in promotionSquares(promotionChoices):
+                board[r][c] = choice.pieceMoved[0] + choice.promotionChoice
+                highlights[(r, c)] = "promotion"
+        if self.pieceRect is not None:  # the squares under the piece of the last frame are drawn again
+            self.invalidate(self.pieceRect)
+        if text != self.text:  # the squares under the old or new text have to be drawn again
+            for rect in filter(None, (self.textRect(self.text), self.textRect(text))):
+                self.invalidate(rect)
+        dirty = self.drawSquares(board, highlights)
+        if self.pieceRect is not None:
+            dirty.append(self.pieceRect)
+            self.pieceRect = None
+        if animation is not None:
+            self.pieceRect = animation.pieceRect(now)
+            self.screen.blit(IMAGES[animation.move.pieceMoved], self.pieceRect)
+            dirty.append(self.pieceRect)
+        textRect = self.textRect(text)
+        if textRect is not None and (text != self.text or textRect.collidelist(dirty) != -1):
+            shadow, surface, _ = self.textSurfaces[text]
+            self.screen.blit(shadow, textRect)
+            self.screen.blit(surface, textRect.move(2, 2))
+            dirty.append(textRect.inflate(4, 4))
+        self.text = text
+        if dirty:
+            p.display.update(dirty)
+
+    """
+    Draw the squares whose piece or highlight differs from the screen, returns their rectangles
+    """
+
+    def drawSquares(self, board, highlights):
+        dirty = []
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                content = (board[r][c], highlights.get((r, c)))
+                if self.shown[r][c] != content:
+                    self.drawSquare(r, c, *content)
+                    dirty.append(squareRect(r, c))
+        return dirty
+
+    def drawSquare(self, r, c, piece, highlight=None):
+        rect = squareRect(r, c)
+        self.screen.blit(self.background, rect, rect)
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight], rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+        self.shown[r][c] = (piece, highlight)
+
+    """
+    Forget what the squares under rect show, the next draw paints them again
+    """
+
+    def invalidate(self, rect):
+        for r in range(max(0, rect.top // SQ_SIZE), min(DIMENSION, (rect.bottom - 1) // SQ_SIZE + 1)):
+            for c in range(max(0, rect.left // SQ_SIZE), min(DIMENSION, (rect.right - 1) // SQ_SIZE + 1)):
+                self.shown[r][c] = None
+
+    """
+    Screen rectangle of the text centered on the board, rendering and caching the text the first time, None for no text
+    """
+
+    def textRect(self, text):
+        if text is None:
+            return None
+        if text not in self.textSurfaces:
+            if self.font is None:
+                self.font = p.font.SysFont("Helvitca", 32, True, False)
+            shadow = self.font.render(text, 0, p.Color('Gray'))
+            surface = self.font.render(text, 0, p.Color('Black'))
+            rect = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH / 2 - shadow.get_width() / 2,
+                                                    HEIGHT / 2 - shadow.get_height() / 2)
+            self.textSurfaces[text] = (shadow, surface, p.Rect(rect.topleft, shadow.get_size()))
+        return self.textSurfaces[text][2]
+
+
+def squareRect(r, c):
+    return p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
 
 
 """
-responsible for all the graphics withing a current game state.
+Highlight square selected and moves for piece selected, as a dict from (row, col) to "selected" or "target"
 """
 
 
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen)  # draw squares of the board
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)  # draw pieces on top of the squares
+def squareHighlights(gs, validMoves, sqSelected):
+    highlights = {}
+    if sqSelected != ():  # didn't choose empty square
+        r, c = sqSelected
+        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+            highlights[(r, c)] = "selected"
+            for move in validMoves:  # highlight moves from that square
+                if move.startRow == r and move.startCol == c:
+                    highlights[(move.endRow, move.endCol)] = "target"
+    return highlights
 
 
 """
-draw the squares on the board. the top left square is always light.
+(square, move) of every promotion choice, the first on the promotion square and the others below it towards the middle
+of the board
 """
 
 
-def drawBoard(screen):
-    global colors
-    colors = [p.Color("white"), p.Color("gray")]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[((r + c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+def promotionSquares(promotionChoices):
+    squares = []
+    for i, choice in enumerate(promotionChoices):
+        step = 1 if choice.endRow == 0 else -1
+        squares.append(((choice.endRow + i * step, choice.endCol), choice))
+    return squares
 
 
 """
-Animating a move
+A move sliding from its start to its end square. The position comes from the time since the animation started, so the
+piece is where it should be at any frame rate and the main loop goes on handling input and the AI meanwhile.
 """
 
 
-def animateMove(move, screen, board, clock):
-    global colors
-    coords = []  # list of coords that the animation will move through
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 10  # frames to move one square
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r, c = (move.startRow + dR * frame / frameCount, move.startCol + dC * frame / frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        # erase the piece moved from its ending square
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        # draw captured piece onto rectangle
-        if move.pieceCaptured != '--':
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        # draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
+class MoveAnimation:
+    def __init__(self, move, now, secondsPerSquare=ANIMATION_SECONDS_PER_SQUARE):
+        self.move = move
+        self.start = now
+        self.duration = (abs(move.endRow - move.startRow) + abs(move.endCol - move.startCol)) * secondsPerSquare
+
+    def progress(self, now):
+        if self.duration <= 0:
+            return 1.0
+        return min(1.0, max(0.0, (now - self.start) / self.duration))
+
+    def done(self, now):
+        return self.progress(now) >= 1.0
+
+    """
+    Play the rest of the animation factor times faster, the piece carries on from where it is
+    """
 
+    def speedUp(self, now, factor):
+        progress = self.progress(now)
+        self.duration /= factor
+        self.start = now - progress * self.duration
 
-def drawText(screen, text):
-    font = p.font.SysFont("Helvitca", 32, True, False)
-    textObject = font.render(text, 0, p.Color('Gray'))
-    textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH / 2 - textObject.get_width() / 2,
-                                                    HEIGHT / 2 - textObject.get_height() / 2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color('Black'))
-    screen.blit(textObject, textLocation.move(2, 2))
+    def pieceRect(self, now):
+        move = self.move
+        t = self.progress(now)
+        r = move.startRow + (move.endRow - move.startRow) * t
+        c = move.startCol + (move.endCol - move.startCol) * t
+        return p.Rect(round(c * SQ_SIZE), round(r * SQ_SIZE), SQ_SIZE, SQ_SIZE)
 
 
 if __name__ == "__main__":
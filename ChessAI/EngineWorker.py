@@ -0,0 +1,160 @@
+"""
+Runs the AI search in a background process so the pygame loop keeps drawing and handling events while the AI thinks.
+The process stays alive for the whole game and keeps its own transposition table between moves. The main loop hands
+it a copy of the GameState with startSearch, then calls poll every frame until the SearchResult arrives. Given a
+Polyglot book the worker answers from the book while the game is still in it, given a tablebase folder it plays
+endgames with few pieces from the tables.
+
+Every search gets an id and the id of the search the GUI still wants is kept in shared memory. The search checks it
+through its stopEvent and stops when the id changes, so cancel (undo, reset) stops a running search within about 1024
+nodes, and results of cancelled searches that were already on their way are thrown away by poll.
+
+Pondering: after its move the AI goes on searching while the human thinks, on the position after the reply it
+expects (the second move of its principal variation), with no depth or time limit and into the same transposition
+table. If the human plays that move, ponderHit turns the ponder search into the search for the AI's answer: it stops
+as soon as it is at least depth plies deep (or timeLimit seconds after the ponderhit), which is often at once. Any other
+move cancels it and a normal search starts, still with the table warmed up by the ponder search.
+"""
+
+import multiprocessing
+import pickle
+import queue
+import time
+
+import SmartMoveFinder
+
+
+class _SearchCancelled:  # stopEvent of one search, set once the GUI wants another search or none at all
+    def __init__(self, currentID, searchID):
+        self.currentID = currentID
+        self.searchID = searchID
+
+    def is_set(self):
+        return self.currentID.value != self.searchID
+
+
+class _PonderStop(_SearchCancelled):  # stopEvent of a ponder search, only set by the ponderhit once deep enough
+    def __init__(self, currentID, searchID, ponderHitAt, depth, timeLimit):
+        super().__init__(currentID, searchID)
+        self.ponderHitAt = ponderHitAt
+        self.depth = depth
+        self.timeLimit = timeLimit
+        self.finishedDepth = 0
+
+    def iterationFinished(self, result):
+        self.finishedDepth = result.depth
+
+    def is_set(self):
+        if super().is_set():
+            return True
+        hitAt = self.ponderHitAt.value
+        if hitAt == 0:  # the human is still thinking
+            return False
+        return self.finishedDepth >= self.depth or \
+            (self.timeLimit is not None and time.time() >= hitAt + self.timeLimit)
+
+
+def _workerLoop(commands, results, currentID, ponderHitAt, depth, timeLimit, bookPath, tablebaseDir):
+    SmartMoveFinder.loadOpeningBook(bookPath)
+    SmartMoveFinder.loadTablebases(tablebaseDir)
+    while True:
+        command = commands.get()
+        if command is None:
+            break
+        searchID, data, ponderMove = command
+        if currentID.value != searchID:  # cancelled before it started
+            continue
+        gs = pickle.loads(data)
+        if ponderMove is not None:
+            gs.makeMove(ponderMove)
+        validMoves = gs.getValidMoves()
+        bookMove = SmartMoveFinder.findBookMove(gs, validMoves)
+        if bookMove is not None:
+            result = SmartMoveFinder.SearchResult(bookMove, 0, [bookMove], 0, 0, 0.0)
+        elif ponderMove is None:
+            result = SmartMoveFinder.searchBestMove(gs, depth, timeLimit, validMoves=validMoves,
+                                                    stopEvent=_SearchCancelled(currentID, searchID))
+        else:
+            stop = _PonderStop(currentID, searchID, ponderHitAt, depth, timeLimit)
+            result = SmartMoveFinder.searchBestMove(gs, SmartMoveFinder.MAX_PLY, validMoves=validMoves,
+                                                    stopEvent=stop, onIteration=stop.iterationFinished)
+        results.put((searchID, result))
+
+
+class EngineWorker:
+    def __init__(self, depth=SmartMoveFinder.DEPTH, timeLimit=None, bookPath=None, tablebaseDir=None):
+        self.commands = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.currentID = multiprocessing.Value('i', 0, lock=False)  # id of the search the GUI waits for, 0 for none
+        self.ponderHitAt = multiprocessing.Value('d', 0.0, lock=False)  # time.time() of the ponderhit, 0 before it
+        self.searchID = 0
+        self.ponderMove = None  # move the running ponder search expects, None when not pondering
+        self.process = multiprocessing.Process(target=_workerLoop, daemon=True,
+                                               args=(self.commands, self.results, self.currentID, self.ponderHitAt,
+                                                     depth, timeLimit, bookPath, tablebaseDir))
+        self.process.start()
+
+    """
+    Start searching gs, cancels the search still running. gs is copied, the caller may keep playing on it.
+    """
+
+    def startSearch(self, gs):
+        self._start(gs, None)
+
+    """
+    Search on the human's time: the position after ponderMove is searched until ponderHit or cancel. Call it after the
+    AI's move is made on gs, with the second move of the AI's principal variation.
+    """
+
+    def startPonder(self, gs, ponderMove):
+        self._start(gs, ponderMove)
+
+    def _start(self, gs, ponderMove):
+        self.searchID += 1
+        self.currentID.value = self.searchID
+        self.ponderHitAt.value = 0.0
+        self.ponderMove = ponderMove
+        # pickled here, Queue.put pickles on a feeder thread and the GUI may already change gs by then
+        self.commands.put((self.searchID, pickle.dumps(gs), ponderMove))
+
+    """
+    The human played move. Returns True if it was the move pondered on, the ponder search then answers through poll.
+    Otherwise the ponder search is cancelled and the caller starts a new search.
+    """
+
+    def ponderHit(self, move):
+        pondered = self.ponderMove is not None and self.currentID.value == self.searchID and \
+            move.moveID == self.ponderMove.moveID
+        self.ponderMove = None
+        if pondered:
+            self.ponderHitAt.value = time.time()
+        else:
+            self.cancel()
+        return pondered
+
+    """
+    SearchResult of the current search once it is done, None while it is still thinking
+    """
+
+    def poll(self):
+        if self.ponderMove is not None:  # pondering, its result waits for the ponderhit
+            return None
+        while True:
+            try:
+                searchID, result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if searchID == self.currentID.value:
+                self.currentID.value = 0
+                return result
+
+    def cancel(self):
+        self.currentID.value = 0
+        self.ponderMove = None
+
+    def close(self):
+        self.cancel()
+        self.commands.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
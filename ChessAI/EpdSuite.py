@@ -0,0 +1,168 @@
+"""
+EPD test suites. An EPD line is the first four FEN fields followed by operations like
+    r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - bm Qxf7#; id "scholar";
+where bm is the best move (or moves) and am a move to avoid, both in SAN. The runner reads the suite line by line,
+searches every position for a fixed time and depth in a process pool and counts a position as solved when the search
+picks a bm move and no am move. Positions without bm or am are only timed, for benchmarks.
+
+python EpdSuite.py suite.epd -t 1.0 -j 4     search each position for 1 second on 4 processes
+python EpdSuite.py suite.epd -d 4 --limit 100  search the first 100 positions to depth 4
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import shlex
+import time
+
+import ChessEngine
+import SmartMoveFinder
+
+MAX_DEPTH = 64
+
+
+"""
+(FEN, operations) of an EPD line, operations maps the opcode to its list of operands with quotes taken off. The move
+counters come from the hmvc and fmvn operations if there are any.
+"""
+
+
+def parseEpd(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("not an EPD line: " + line)
+    operations = {}
+    rest = fields[4] if len(fields) > 4 else ""
+    while rest.strip():
+        operation, _, rest = _splitOperation(rest)
+        tokens = operation.split(None, 1)
+        if tokens:
+            operations[tokens[0]] = shlex.split(tokens[1]) if len(tokens) > 1 else []
+    fen = " ".join(fields[:4]) + " %s %s" % (operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0])
+    return fen, operations
+
+
+def _splitOperation(text):
+    inQuotes = False
+    for i, ch in enumerate(text):
+        if ch == '"':
+            inQuotes = not inQuotes
+        elif ch == ';' and not inQuotes:
+            return text[:i], ';', text[i + 1:]
+    return text, '', ''
+
+
+"""
+EPD line of the position with the given operations, e.g. {"bm": ["Nf3"], "id": ["test 1"]}
+"""
+
+
+def toEpd(gs, operations=None):
+    epd = " ".join(gs.getFen().split()[:4])
+    for opcode, operands in (operations or {}).items():
+        epd += " %s %s;" % (opcode, " ".join('"%s"' % operand if " " in operand or opcode == "id" else operand
+                                             for operand in operands))
+    return epd
+
+
+def _plainSan(san):  # suites write checks, annotations and promotions in different ways
+    return san.rstrip("+#!?").replace("=", "")
+
+
+"""
+Search one suite position. Returns a dict with the line number, the id, the move found, whether that solves the
+position (None without bm and am) and the search statistics.
+"""
+
+
+def solvePosition(task):
+    number, line, timeLimit, depth = task
+    fen, operations = parseEpd(line)
+    gs = ChessEngine.GameState(fen)
+    SmartMoveFinder.transpositionTable.clear()  # every position is searched from scratch
+    result = SmartMoveFinder.searchBestMove(gs, depth, timeLimit)
+    san = gs.getSAN(result.move) if result.move is not None else "none"
+    solved = None
+    if "bm" in operations or "am" in operations:
+        solved = True
+        if "bm" in operations:
+            solved = _plainSan(san) in {_plainSan(move) for move in operations["bm"]}
+        if "am" in operations and _plainSan(san) in {_plainSan(move) for move in operations["am"]}:
+            solved = False
+    return {"number": number, "id": " ".join(operations.get("id", [str(number)])), "move": san, "solved": solved,
+            "expected": " ".join(operations.get("bm", [])) or "not " + " ".join(operations.get("am", [])),
+            "score": result.score, "depth": result.depth, "nodes": result.nodes, "seconds": result.seconds}
+
+
+def _solveIndexed(task):
+    index, task = task
+    return index, solvePosition(task)
+
+
+"""
+Read the suite file lazily, yielding (line number, line) of every position, at most limit of them
+"""
+
+
+def readSuite(path, limit=None):
+    with open(path) as f:
+        lines = ((number, line.strip()) for number, line in enumerate(f, 1))
+        yield from itertools.islice(((number, line) for number, line in lines if line and not line.startswith("#")),
+                                    limit)
+
+
+"""
+Search every position of the suite in a process pool. Workers take the next position as soon as they are done, so
+one slow position holds up only its own worker. Misses are printed in suite order, results that finish early wait
+until the positions before them are in. Returns a dict with the totals.
+"""
+
+
+def runSuite(path, timeLimit=1.0, depth=MAX_DEPTH, workers=os.cpu_count() or 1, limit=None, verbose=True):
+    start = time.perf_counter()
+    positions = solved = scored = nodes = depths = 0
+    tasks = enumerate((number, line, timeLimit, depth) for number, line in readSuite(path, limit))
+    waiting = {}  # index -> result of positions that finished before an earlier one
+    nextIndex = 0
+    with multiprocessing.Pool(workers) as pool:
+        for index, result in pool.imap_unordered(_solveIndexed, tasks, chunksize=1):
+            waiting[index] = result
+            while nextIndex in waiting:
+                result = waiting.pop(nextIndex)
+                nextIndex += 1
+                positions += 1
+                nodes += result["nodes"]
+                depths += result["depth"]
+                if result["solved"] is not None:
+                    scored += 1
+                    solved += result["solved"]
+                    if verbose and not result["solved"]:
+                        print("miss %-24s played %-8s expected %-16s score %6d depth %d" %
+                              (result["id"], result["move"], result["expected"], result["score"], result["depth"]))
+    seconds = time.perf_counter() - start
+    totals = {"positions": positions, "scored": scored, "solved": solved,
+              "solveRate": solved / scored if scored else 0.0, "seconds": seconds,
+              "positionsPerSecond": positions / seconds if seconds else 0.0,
+              "nodesPerSecond": nodes / seconds if seconds else 0.0,
+              "averageDepth": depths / positions if positions else 0.0}
+    if verbose:
+        print("solved %d of %d (%.1f%%), %d positions in %.1fs, %.2f positions/s, %.0f nodes/s, average depth %.1f" %
+              (solved, scored, 100 * totals["solveRate"], positions, seconds, totals["positionsPerSecond"],
+               totals["nodesPerSecond"], totals["averageDepth"]))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the positions of an EPD suite and report the solve rate.")
+    parser.add_argument("suite", help="EPD file, one position per line")
+    parser.add_argument("-t", "--time", type=float, default=1.0, help="seconds per position")
+    parser.add_argument("-d", "--depth", type=int, default=MAX_DEPTH, help="deepest iteration per position")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int, help="only the first positions of the suite")
+    args = parser.parse_args()
+    runSuite(args.suite, args.time, args.depth, args.workers, args.limit)
+
+
+if __name__ == "__main__":
+    main()
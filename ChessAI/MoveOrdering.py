@@ -0,0 +1,75 @@
+"""
+Move ordering for the search. Alpha-beta prunes the most when the best move is searched first, so moves are sorted:
+captures and promotions by MVV-LVA (most valuable victim, least valuable attacker), then the killer moves of the ply,
+then the remaining quiet moves by their history score. The hash move from the transposition table comes before all of
+them, GameState.generateMoves hands it out on its own.
+"""
+
+from PieceSquareTables import PIECE_POINTS
+
+CAPTURE_SCORE = 100000
+FIRST_KILLER_SCORE = 90000
+SECOND_KILLER_SCORE = 80000
+HISTORY_LIMIT = 50000  # history scores are halved once one gets this big so quiet moves stay below the killers
+
+
+class MoveOrderer:
+    def __init__(self, maxPly=64):
+        self.killers = [[None, None] for _ in range(maxPly + 1)]  # two quiet moveIDs per ply that caused a cutoff
+        self.history = {}  # (pieceMoved, end square) -> how often and how deep that quiet move caused cutoffs
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+
+    """
+    Sort moves in place, best candidates first
+    """
+
+    def orderMoves(self, moves, ply):
+        killers = self.killers[ply]
+        history = self.history
+        pieceScore = PIECE_POINTS
+        scores = []
+        for move in moves:
+            if move.pieceCaptured != "--" or move.pawnPromotion:
+                score = CAPTURE_SCORE - pieceScore[move.pieceMoved[1]]
+                if move.pieceCaptured != "--":
+                    score += 10 * pieceScore[move.pieceCaptured[1]]
+                if move.pawnPromotion:
+                    score += 10 * pieceScore[move.promotionChoice]
+            elif move.moveID == killers[0]:
+                score = FIRST_KILLER_SCORE
+            elif move.moveID == killers[1]:
+                score = SECOND_KILLER_SCORE
+            else:
+                score = history.get((move.pieceMoved, move.endRow * 8 + move.endCol), 0)
+            scores.append(score)
+        order = sorted(range(len(moves)), key=scores.__getitem__, reverse=True)
+        moves[:] = [moves[i] for i in order]
+        return moves
+
+    """
+    Called when move caused a beta cutoff. moveIndex is its position in the ordered list.
+    """
+
+    def recordCutoff(self, move, depth, ply, moveIndex):
+        self.cutoffs += 1
+        if moveIndex == 0:
+            self.firstMoveCutoffs += 1
+        if move.pieceCaptured != "--" or move.pawnPromotion:  # captures are already ordered by MVV-LVA
+            return
+        killers = self.killers[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+        key = (move.pieceMoved, move.endRow * 8 + move.endCol)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+        if self.history[key] > HISTORY_LIMIT:
+            for k in self.history:
+                self.history[k] //= 2
+
+    """
+    Share of beta cutoffs that came from the first move searched, the closer to 1 the better the ordering
+    """
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
@@ -0,0 +1,102 @@
+"""
+Root split parallel search. CPython runs one search on one core, so to use more cores the root moves are dealt out to
+worker processes, every worker runs the normal iterative deepening search over its share of the root moves with its
+own transposition table, and the best of their results is the answer. Root moves are ordered first and dealt round
+robin so every worker gets some of the promising moves.
+Workers don't share alpha bounds or table entries, so they search more nodes in total than one search over all moves
+would, the speedup is below the number of workers.
+Run this file directly to compare 1 worker with all cores: python ParallelSearch.py [workers] [depth]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import ChessEngine
+import SmartMoveFinder
+from MoveOrdering import MoveOrderer
+
+WORKERS = os.cpu_count() or 1
+
+
+def _searchShare(gs, depth, timeLimit, rootMoves):
+    return SmartMoveFinder.searchBestMove(gs, depth, timeLimit, validMoves=rootMoves)
+
+
+"""
+Search gs with up to workers processes and merge their results into one SearchResult. Every worker gets at least two
+root moves, the search doesn't search a lone root move and its score of 0 would win against real scores. The merged
+result carries the best move and its PV, the nodes of all workers and the shallowest depth the searching workers
+finished, as a timed out worker may be an iteration behind the others. Workers that timed out before finishing depth 1
+have no score and are left out.
+"""
+
+
+def searchParallel(gs, depth=SmartMoveFinder.DEPTH, workers=WORKERS, timeLimit=None, validMoves=None):
+    start = time.perf_counter()
+    rootMoves = MoveOrderer().orderMoves(list(gs.getValidMoves() if validMoves is None else validMoves), 0)
+    workers = max(1, min(workers, len(rootMoves) // 2))
+    if workers == 1:
+        return SmartMoveFinder.searchBestMove(gs, depth, timeLimit, validMoves=rootMoves)
+    shares = [rootMoves[i::workers] for i in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(_searchShare, [(gs, depth, timeLimit, share) for share in shares])
+    searched = [result for result in results if result.depth > 0] or results
+    best = max(searched, key=lambda result: result.score)
+    best.depth = min(result.depth for result in searched)
+    best.nodes = sum(result.nodes for result in results)
+    best.firstMoveCutoffRate = sum(result.firstMoveCutoffRate for result in results) / workers
+    best.seconds = time.perf_counter() - start
+    return best
+
+
+def findBestMoveParallel(gs, validMoves, depth=SmartMoveFinder.DEPTH, workers=WORKERS):
+    return searchParallel(gs, depth, workers, validMoves=validMoves).move
+
+
+"""
+Time the same searches with 1 worker and with workers processes, both from empty tables: forked workers would inherit
+the table the 1 worker run just filled and search far fewer nodes. Prints one line per position and the total nodes of
+both, so the extra nodes of workers that don't share bounds show up next to the time. Returns the overall speedup, the
+wall time of 1 worker divided by the wall time of all workers.
+"""
+
+
+def compareWorkers(workers=WORKERS, depth=4, fens=None):
+    if fens is None:
+        fens = [ChessEngine.STARTING_FEN,
+                "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8"]
+    serialTime = parallelTime = 0.0
+    serialNodes = parallelNodes = 0
+    for fen in fens:
+        gs = ChessEngine.GameState()
+        gs.loadFen(fen)
+        _clearTables()
+        serial = searchParallel(gs, depth, 1)
+        _clearTables()
+        parallel = searchParallel(gs, depth, workers)
+        serialTime += serial.seconds
+        parallelTime += parallel.seconds
+        serialNodes += serial.nodes
+        parallelNodes += parallel.nodes
+        print("%-60s 1 worker: %s %6d cp %8d nodes %6.2fs   %d workers: %s %6d cp %8d nodes %6.2fs" %
+              (fen[:60], serial.move, serial.score, serial.nodes, serial.seconds,
+               workers, parallel.move, parallel.score, parallel.nodes, parallel.seconds))
+    print("total 1 worker: %d nodes %.2fs   %d workers: %d nodes %.2fs, %.2fx the nodes" %
+          (serialNodes, serialTime, workers, parallelNodes, parallelTime,
+           parallelNodes / serialNodes if serialNodes else 0))
+    return serialTime / parallelTime
+
+
+def _clearTables():  # workers fork from this process and start with its tables
+    SmartMoveFinder.transpositionTable.clear()
+    SmartMoveFinder.pawnCache.clear()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print("cores:", os.cpu_count(), "workers:", workers, "depth:", depth)
+    print("speedup: %.2fx" % compareWorkers(workers, depth))
@@ -0,0 +1,201 @@
+"""
+Pawn structure evaluation with a cache keyed on the pawn-only Zobrist key of the GameState. Doubled, isolated,
+backward and passed pawns depend on nothing but where the pawns stand, and the pawns rarely change between the
+positions of a search, so the terms are computed once per pawn structure and looked up after that.
+Masks are 64-bit integers like the bitboards of BitboardEngine, bit row * 8 + col for the square board[row][col].
+Every cache entry keeps the (middlegame, endgame) score from white's point of view and the passed pawns of both sides.
+Run this file directly to search a few positions and print the hit rate of the cache.
+"""
+
+import time
+
+from PieceSquareTables import TOTAL_PHASE
+
+WHITE, BLACK = 0, 1
+
+# (middlegame, endgame) centipawns
+DOUBLED_PAWN = (-10, -20)  # for every pawn with a pawn of its own color in front of it on the file
+ISOLATED_PAWN = (-10, -15)  # no pawn of its own color on the files next to it
+BACKWARD_PAWN = (-8, -10)  # no pawn of its own color next to or behind it and its stop square guarded by an enemy pawn
+# passed pawn bonus by rank counted from the pawn's own side, 1 to 8 as index 0 to 7
+PASSED_PAWN_MG = (0, 0, 5, 10, 20, 35, 60, 0)
+PASSED_PAWN_EG = (0, 5, 10, 20, 35, 60, 100, 0)
+
+# rough bytes one entry costs in CPython: the key int, the entry tuple with its ints and two list pointers
+ENTRY_BYTES = 150
+PAWN_CACHE_SIZE_MB = 1
+
+
+def _mask(squares):
+    mask = 0
+    for r, c in squares:
+        if 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << (r * 8 + c)
+    return mask
+
+
+FILE_MASKS = [_mask((r, c) for r in range(8)) for c in range(8)]
+ADJACENT_FILE_MASKS = [(FILE_MASKS[c - 1] if c > 0 else 0) | (FILE_MASKS[c + 1] if c < 7 else 0) for c in range(8)]
+# indexed by color then square, white pawns move towards row 0
+FRONT_SPANS = [[_mask((row, sq % 8) for row in (range(sq // 8) if color == WHITE else range(sq // 8 + 1, 8)))
+                for sq in range(64)] for color in (WHITE, BLACK)]
+# squares in front on the pawn's file and the files next to it, no enemy pawn there means the pawn is passed
+PASSED_MASKS = [[_mask((row, col) for row in (range(sq // 8) if color == WHITE else range(sq // 8 + 1, 8))
+                       for col in (sq % 8 - 1, sq % 8, sq % 8 + 1))
+                 for sq in range(64)] for color in (WHITE, BLACK)]
+# squares on the files next to the pawn on its row and behind it, where a pawn could come up to support it
+SUPPORT_MASKS = [[_mask((row, col) for row in (range(sq // 8, 8) if color == WHITE else range(sq // 8 + 1))
+                        for col in (sq % 8 - 1, sq % 8 + 1))
+                  for sq in range(64)] for color in (WHITE, BLACK)]
+# enemy pawns on these squares guard the square in front of the pawn
+STOP_GUARD_MASKS = [[_mask((sq // 8 - 2 if color == WHITE else sq // 8 + 2, sq % 8 + d) for d in (-1, 1))
+                     for sq in range(64)] for color in (WHITE, BLACK)]
+
+
+def _squares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+"""
+(white pawns, black pawns) bitboards of the position, read off the bitboard backend or the list board
+"""
+
+
+def pawnBitboards(gs):
+    bitboards = getattr(gs, "bitboards", None)
+    if bitboards:
+        return bitboards['wp'], bitboards['bp']
+    whitePawns = blackPawns = 0
+    for r, row in enumerate(gs.board):
+        for c, square in enumerate(row):
+            if square == 'wp':
+                whitePawns |= 1 << (r * 8 + c)
+            elif square == 'bp':
+                blackPawns |= 1 << (r * 8 + c)
+    return whitePawns, blackPawns
+
+
+"""
+Evaluate the pawn structure from scratch. Returns (middlegame score, endgame score, white passed pawns, black passed
+pawns), the scores from white's point of view and the passed pawns as bitboards.
+"""
+
+
+def evaluatePawns(whitePawns, blackPawns):
+    mgScore = egScore = 0
+    passed = [0, 0]
+    for color, ours, theirs, sign in ((WHITE, whitePawns, blackPawns, 1), (BLACK, blackPawns, whitePawns, -1)):
+        frontSpans, passedMasks = FRONT_SPANS[color], PASSED_MASKS[color]
+        supportMasks, stopGuardMasks = SUPPORT_MASKS[color], STOP_GUARD_MASKS[color]
+        for sq in _squares(ours):
+            mg = eg = 0
+            col = sq % 8
+            if ours & frontSpans[sq]:
+                mg += DOUBLED_PAWN[0]
+                eg += DOUBLED_PAWN[1]
+            if not ours & ADJACENT_FILE_MASKS[col]:
+                mg += ISOLATED_PAWN[0]
+                eg += ISOLATED_PAWN[1]
+            elif not ours & supportMasks[sq] and theirs & stopGuardMasks[sq]:
+                mg += BACKWARD_PAWN[0]
+                eg += BACKWARD_PAWN[1]
+            if not theirs & passedMasks[sq] and not ours & frontSpans[sq]:  # the frontmost of doubled pawns only
+                rank = 7 - sq // 8 if color == WHITE else sq // 8
+                mg += PASSED_PAWN_MG[rank]
+                eg += PASSED_PAWN_EG[rank]
+                passed[color] |= 1 << sq
+            mgScore += sign * mg
+            egScore += sign * eg
+    return mgScore, egScore, passed[WHITE], passed[BLACK]
+
+
+"""
+Fixed size table of pawn structure evaluations, one entry per slot, a new structure replaces whatever was in its slot
+"""
+
+
+class PawnCache:
+    def __init__(self, sizeMB=PAWN_CACHE_SIZE_MB):
+        slots = 1
+        while slots * 2 * ENTRY_BYTES <= sizeMB * 1024 * 1024:  # largest power of two that fits
+            slots *= 2
+        self.sizeMB = sizeMB
+        self.mask = slots - 1
+        self.keys = [0] * slots
+        self.entries = [None] * slots  # evaluatePawns result
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.keys = [0] * len(self.keys)
+        self.entries = [None] * len(self.entries)
+        self.resetStats()
+
+    """
+    (middlegame score, endgame score, white passed pawns, black passed pawns) of the position's pawns, from the cache
+    or computed and stored
+    """
+
+    def probe(self, gs):
+        key = gs.pawnKeyLog[-1]
+        slot = key & self.mask
+        self.probes += 1
+        entry = self.entries[slot]
+        if entry is not None and self.keys[slot] == key:
+            self.hits += 1
+            return entry
+        entry = evaluatePawns(*pawnBitboards(gs))
+        self.keys[slot] = key
+        self.entries[slot] = entry
+        return entry
+
+    """
+    Pawn structure score in centipawns from white's point of view, tapered by the game phase like
+    GameState.getEvaluation
+    """
+
+    def getScore(self, gs):
+        mgScore, egScore, _, _ = self.probe(gs)
+        phase = min(gs.evaluationLog[-1][2], TOTAL_PHASE)
+        return (mgScore * phase + egScore * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+
+    """
+    (white passed pawns, black passed pawns) bitboards
+    """
+
+    def getPassedPawns(self, gs):
+        return self.probe(gs)[2:]
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def getStats(self):
+        used = sum(entry is not None for entry in self.entries)
+        return {"sizeMB": self.sizeMB, "slots": len(self.entries), "used": used, "probes": self.probes,
+                "hits": self.hits, "hitRate": self.hitRate()}
+
+
+def main():
+    import SmartMoveFinder
+    from Perft import POSITIONS, newGameState
+
+    for name, (fen, _) in POSITIONS.items():
+        gs = newGameState(fen)
+        SmartMoveFinder.transpositionTable.clear()
+        SmartMoveFinder.pawnCache.clear()
+        start = time.perf_counter()
+        result = SmartMoveFinder.searchBestMove(gs, 4)
+        seconds = time.perf_counter() - start
+        stats = SmartMoveFinder.pawnCache.getStats()
+        print("%-10s %8d nodes %6.2fs  pawn cache %8d probes %5.1f%% hits, %d structures" %
+              (name, result.nodes, seconds, stats["probes"], 100 * stats["hitRate"], stats["used"]))
+
+
+if __name__ == "__main__":
+    main()
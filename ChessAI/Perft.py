@@ -0,0 +1,119 @@
+"""
+Perft counts the leaf nodes of the legal move tree of a position to a fixed depth. The counts of the standard test
+positions are known, so any difference means move generation is wrong, and nodes per second is the throughput of
+getValidMoves plus makeMove and undoMove.
+
+python Perft.py                          run all standard positions and compare with the known counts
+python Perft.py -d 4 --position kiwipete count one position to depth 4
+python Perft.py -d 3 --fen "<FEN>" --divide  node count below each root move, to find which move is wrong
+add --bitboard to any of these to run the bitboard backend
+"""
+
+import argparse
+import sys
+import time
+
+import ChessEngine
+from BitboardEngine import BitboardGameState
+
+# name -> (FEN, known node counts for depth 1, 2, 3, ...)
+POSITIONS = {
+    "start": (ChessEngine.STARTING_FEN, (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862, 4085603)),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238, 674624)),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 264, 9467, 422333)),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (44, 1486, 62379, 2103487)),
+}
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:  # no need to make the last moves, just count them
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+"""
+Node count below each root move, as a list of (move notation, nodes)
+"""
+
+
+def divide(gs, depth):
+    counts = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts.append((move.getChessNotation(), perft(gs, depth - 1)))
+        gs.undoMove()
+    return counts
+
+
+def newGameState(fen, bitboard=False):
+    return BitboardGameState(fen) if bitboard else ChessEngine.GameState(fen)
+
+
+"""
+Run every standard position up to maxDepth (or as deep as its known counts go). Prints one line per run and returns
+True if every count matched.
+"""
+
+
+def runSuite(maxDepth=3, bitboard=False):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, (fen, expected) in POSITIONS.items():
+        for depth in range(1, min(maxDepth, len(expected)) + 1):
+            gs = newGameState(fen, bitboard)
+            start = time.perf_counter()
+            nodes = perft(gs, depth)
+            seconds = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += seconds
+            passed = nodes == expected[depth - 1]
+            allPassed = allPassed and passed
+            print("%-10s depth %d  %10d nodes  %8.2fs  %8.0f nps  %s" %
+                  (name, depth, nodes, seconds, nodes / seconds if seconds else 0,
+                   "ok" if passed else "FAIL, expected %d" % expected[depth - 1]))
+    print("total %d nodes in %.2fs, %.0f nps, %s" %
+          (totalNodes, totalTime, totalNodes / totalTime if totalTime else 0, "all ok" if allPassed else "FAILED"))
+    return allPassed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count legal move tree nodes to check and time move generation.")
+    parser.add_argument("-d", "--depth", type=int, default=3)
+    parser.add_argument("--fen", help="position to count, default is the whole standard suite")
+    parser.add_argument("--position", choices=sorted(POSITIONS), help="one of the standard positions")
+    parser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    parser.add_argument("--bitboard", action="store_true", help="use the bitboard backend")
+    args = parser.parse_args()
+
+    if args.fen is None and args.position is None:
+        sys.exit(0 if runSuite(args.depth, args.bitboard) else 1)
+    fen = args.fen if args.fen is not None else POSITIONS[args.position][0]
+    gs = newGameState(fen, args.bitboard)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(gs, args.depth)
+        for notation, nodes in counts:
+            print(notation + ":", nodes)
+        nodes = sum(nodes for _, nodes in counts)
+    else:
+        nodes = perft(gs, args.depth)
+    seconds = time.perf_counter() - start
+    print("nodes: %d  time: %.2fs  nps: %.0f" % (nodes, seconds, nodes / seconds if seconds else 0))
+    if args.position is not None and args.depth <= len(POSITIONS[args.position][1]):
+        expected = POSITIONS[args.position][1][args.depth - 1]
+        print("ok" if nodes == expected else "FAIL, expected %d" % expected)
+        sys.exit(0 if nodes == expected else 1)
+
+
+if __name__ == "__main__":
+    main()
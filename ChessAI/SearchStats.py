@@ -0,0 +1,320 @@
+"""
+Opt-in instrumentation of the search, to see where the time goes and whether a change made the hot path faster.
+InstrumentedSearch is a Search that counts nodes and quiescence nodes, transposition table hits and cutoffs, pawn cache
+hits, tablebase hits, the nodes of every iteration and the branching factor between them, and times the GameState
+methods the search calls and scoreBoard, the whole evaluation. The timers and counters are put on the GameState
+instance, the table and SmartMoveFinder only for the run and taken off again, and plain Search has no hooks at all, so
+a search without stats costs nothing extra. scoreBoard and tablebase probes of other searches running in the same
+process at the time are counted with it. The times include the timers' own overhead, compare them with each other and
+between runs, not with an uninstrumented search. A timed method called from inside another one, like getLegalMoves from
+generateMoves, counts towards the outer one only, so the times add up without overlap.
+A run can also go under cProfile, or under a sampler that looks at the search's stack every few milliseconds.
+
+python SearchStats.py -d 5                       search the perft positions to depth 5 and print the stats
+python SearchStats.py --position kiwipete -t 5 --json stats.json
+python SearchStats.py --fen "<FEN>" -d 6 --profile search.prof --sample 0.005
+add --bitboard to run the bitboard backend
+"""
+
+import argparse
+import collections
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+import SmartMoveFinder
+import TranspositionTable
+from Perft import POSITIONS, newGameState
+
+TIMED_METHODS = ("generateMoves", "getValidMoves", "getValidCaptures", "getLegalMoves", "kingInCheck", "makeMove",
+                 "undoMove")
+EVALUATION = "scoreBoard"  # SmartMoveFinder.scoreBoard, material and piece-square score plus the pawn cache
+TIMED = TIMED_METHODS + (EVALUATION,)
+
+
+class SearchStats:
+    def __init__(self):
+        self.calls = dict.fromkeys(TIMED, 0)
+        self.methodSeconds = dict.fromkeys(TIMED, 0.0)
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.ttCutoffs = 0  # nodes answered from the table without searching
+        self.tablebaseHits = 0
+        self.pawnCacheProbes = 0
+        self.pawnCacheHits = 0
+        self.iterations = []  # one dict per finished depth
+        self.firstMoveCutoffRate = 0.0
+        self.seconds = 0.0
+        self.samples = collections.Counter()  # "file:function" -> times the sampler found the search there
+
+    def nodesPerSecond(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def toDict(self):
+        return {"nodes": self.nodes, "quiescenceNodes": self.quiescenceNodes, "seconds": self.seconds,
+                "nps": self.nodesPerSecond(),
+                "methods": {name: {"calls": self.calls[name], "seconds": self.methodSeconds[name]}
+                            for name in TIMED},
+                "ttProbes": self.ttProbes, "ttHits": self.ttHits,
+                "ttHitRate": self.ttHits / self.ttProbes if self.ttProbes else 0.0, "ttCutoffs": self.ttCutoffs,
+                "pawnCacheProbes": self.pawnCacheProbes, "pawnCacheHits": self.pawnCacheHits,
+                "pawnCacheHitRate": self.pawnCacheHits / self.pawnCacheProbes if self.pawnCacheProbes else 0.0,
+                "tablebaseHits": self.tablebaseHits, "firstMoveCutoffRate": self.firstMoveCutoffRate,
+                "iterations": self.iterations, "samples": dict(self.samples.most_common())}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.toDict(), f, indent=2)
+
+    def report(self, out=sys.stdout):
+        out.write("nodes %d (quiescence %d, %.1f%%) in %.2fs, %.0f nps\n" %
+                  (self.nodes, self.quiescenceNodes, 100 * self.quiescenceNodes / self.nodes if self.nodes else 0,
+                   self.seconds, self.nodesPerSecond()))
+        for name in TIMED:
+            if self.calls[name]:
+                out.write("  %-18s %9d calls %8.3fs %5.1f%% %7.2fus/call\n" %
+                          (name, self.calls[name], self.methodSeconds[name],
+                           100 * self.methodSeconds[name] / self.seconds if self.seconds else 0,
+                           1e6 * self.methodSeconds[name] / self.calls[name]))
+        out.write("tt probes %d, hits %d (%.1f%%), cutoffs %d, tablebase hits %d, first move cutoffs %.1f%%\n" %
+                  (self.ttProbes, self.ttHits, 100 * self.ttHits / self.ttProbes if self.ttProbes else 0,
+                   self.ttCutoffs, self.tablebaseHits, 100 * self.firstMoveCutoffRate))
+        out.write("pawn cache probes %d, hits %d (%.1f%%)\n" %
+                  (self.pawnCacheProbes, self.pawnCacheHits,
+                   100 * self.pawnCacheHits / self.pawnCacheProbes if self.pawnCacheProbes else 0))
+        for iteration in self.iterations:
+            out.write("  depth %2d %9d nodes %7.2fs  branching factor %s\n" %
+                      (iteration["depth"], iteration["nodes"], iteration["seconds"],
+                       "%.2f" % iteration["branchingFactor"] if iteration["branchingFactor"] else "-"))
+        if self.samples:
+            total = sum(self.samples.values())
+            out.write("samples %d, most frequent:\n" % total)
+            for where, count in self.samples.most_common(10):
+                out.write("  %5.1f%% %s\n" % (100 * count / total, where))
+
+
+class InstrumentedSearch(SmartMoveFinder.Search):
+    def __init__(self, gs, tt, stats=None, timeLimit=None, stopEvent=None, onIteration=None):
+        super().__init__(gs, tt, timeLimit, stopEvent, self.iterationFinished)
+        self.stats = SearchStats() if stats is None else stats
+        self.userOnIteration = onIteration
+        self.startTime = 0.0
+        self.nodesBeforeIteration = 0
+        self.lastIterationNodes = 0
+        self.node = None  # (depth, alpha, beta) of the negaMax node being entered, for the table probe it makes
+        self.timing = False  # inside a timed call, timed calls made from there aren't counted again
+
+    def iterativeDeepening(self, maxDepth, rootMoves=None):
+        gs = self.gs
+        stats = self.stats
+        ttProbes, ttHits = self.tt.probes, self.tt.hits
+        pawnCache = SmartMoveFinder.pawnCache
+        pawnCacheProbes, pawnCacheHits = pawnCache.probes, pawnCache.hits
+        for name in TIMED_METHODS:  # instance attributes shadow the methods until they are deleted again
+            method = getattr(gs, name)
+            setattr(gs, name, self._timedGenerator(name, method) if name == "generateMoves" else
+                    self._timed(name, method))
+        self.tt.probe = self._countingProbe(self.tt.probe)
+        scoreBoard, tablebaseScore = SmartMoveFinder.scoreBoard, SmartMoveFinder.tablebaseScore
+        SmartMoveFinder.scoreBoard = self._timed(EVALUATION, scoreBoard)  # the search looks both up on every call
+        SmartMoveFinder.tablebaseScore = self._countingTablebaseScore(tablebaseScore)
+        self.startTime = time.perf_counter()
+        try:
+            result = super().iterativeDeepening(maxDepth, rootMoves)
+        finally:
+            for name in TIMED_METHODS:
+                delattr(gs, name)
+            del self.tt.probe
+            SmartMoveFinder.scoreBoard, SmartMoveFinder.tablebaseScore = scoreBoard, tablebaseScore
+        stats.seconds += time.perf_counter() - self.startTime
+        stats.nodes += self.nodes
+        stats.ttProbes += self.tt.probes - ttProbes
+        stats.ttHits += self.tt.hits - ttHits
+        stats.pawnCacheProbes += pawnCache.probes - pawnCacheProbes
+        stats.pawnCacheHits += pawnCache.hits - pawnCacheHits
+        stats.firstMoveCutoffRate = result.firstMoveCutoffRate
+        return result
+
+    def _timed(self, name, method):
+        calls = self.stats.calls
+        seconds = self.stats.methodSeconds
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            if self.timing:
+                return method(*args, **kwargs)
+            self.timing = True
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - start
+                calls[name] += 1
+                self.timing = False
+        return timed
+
+    def _timedGenerator(self, name, method):  # times every step of the generator, not the search between them
+        calls = self.stats.calls
+        seconds = self.stats.methodSeconds
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            if self.timing:
+                yield from method(*args, **kwargs)
+                return
+            calls[name] += 1
+            generator = method(*args, **kwargs)
+            while True:
+                self.timing = True
+                start = clock()
+                try:
+                    move = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds[name] += clock() - start
+                    self.timing = False
+                yield move
+        return timed
+
+    def iterationFinished(self, result):
+        nodes = self.nodes - self.nodesBeforeIteration  # aspiration re-searches included
+        self.nodesBeforeIteration = self.nodes
+        self.stats.iterations.append({"depth": result.depth, "nodes": nodes,
+                                      "seconds": time.perf_counter() - self.startTime,
+                                      "branchingFactor": nodes / self.lastIterationNodes
+                                      if self.lastIterationNodes else None})
+        self.lastIterationNodes = nodes
+        if self.userOnIteration is not None:
+            self.userOnIteration(result)
+
+    """
+    The table probe of a negaMax node comes before any of its children are searched, so the node recorded here is the
+    one probing
+    """
+
+    def negaMax(self, depth, alpha, beta, ply):
+        self.node = (depth, alpha, beta, ply)
+        return super().negaMax(depth, alpha, beta, ply)
+
+    """
+    Wraps the table's probe to count the entries that let negaMax return the stored score without searching
+    """
+
+    def _countingProbe(self, probe):
+        stats = self.stats
+
+        def countingProbe(key):
+            entry = probe(key)
+            if entry is not None:
+                depth, alpha, beta, ply = self.node
+                entryDepth, entryScore, bound, _ = entry
+                entryScore = SmartMoveFinder.scoreFromTable(entryScore, ply)
+                if entryDepth >= depth and (bound == TranspositionTable.EXACT or
+                                            (bound == TranspositionTable.LOWER_BOUND and entryScore >= beta) or
+                                            (bound == TranspositionTable.UPPER_BOUND and entryScore <= alpha)):
+                    stats.ttCutoffs += 1
+            return entry
+        return countingProbe
+
+    def _countingTablebaseScore(self, tablebaseScore):
+        stats = self.stats
+
+        def countingTablebaseScore(gs, ply):
+            score = tablebaseScore(gs, ply)
+            if score is not None:
+                stats.tablebaseHits += 1
+            return score
+        return countingTablebaseScore
+
+    def quiescence(self, alpha, beta, ply):
+        self.stats.quiescenceNodes += 1
+        return super().quiescence(alpha, beta, ply)
+
+
+"""
+Counts where the thread is every interval seconds, by the function of the innermost frame, until stop is set
+"""
+
+
+def _sampleThread(threadID, interval, samples, stop):
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(threadID)
+        if frame is not None:
+            code = frame.f_code
+            samples["%s:%s" % (os.path.basename(code.co_filename), code.co_name)] += 1
+
+
+"""
+Search like searchBestMove with an InstrumentedSearch. profilePath writes cProfile statistics there (readable with
+pstats), sampleInterval samples the stack every that many seconds into stats.samples. Returns (SearchResult, stats).
+"""
+
+
+def searchWithStats(gs, depth=SmartMoveFinder.DEPTH, timeLimit=None, tt=None, stats=None, profilePath=None,
+                    sampleInterval=None):
+    search = InstrumentedSearch(gs, SmartMoveFinder.transpositionTable if tt is None else tt, stats, timeLimit)
+    stopSampling = threading.Event()
+    sampler = None
+    if sampleInterval is not None:
+        sampler = threading.Thread(target=_sampleThread, daemon=True,
+                                   args=(threading.get_ident(), sampleInterval, search.stats.samples, stopSampling))
+        sampler.start()
+    profiler = cProfile.Profile() if profilePath is not None else None
+    try:
+        if profiler is not None:
+            result = profiler.runcall(search.iterativeDeepening, depth)
+        else:
+            result = search.iterativeDeepening(depth)
+    finally:
+        stopSampling.set()
+        if sampler is not None:
+            sampler.join()
+    if profiler is not None:
+        profiler.dump_stats(profilePath)
+    return result, search.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search positions with instrumentation and report where time goes.")
+    parser.add_argument("-d", "--depth", type=int, default=4)
+    parser.add_argument("-t", "--time", type=float, help="seconds per position, searched up to --depth")
+    parser.add_argument("--fen", help="position to search, default is every perft position")
+    parser.add_argument("--position", choices=sorted(POSITIONS), help="one of the perft positions")
+    parser.add_argument("--bitboard", action="store_true", help="use the bitboard backend")
+    parser.add_argument("--json", help="write the stats of all positions to this file")
+    parser.add_argument("--profile", help="write cProfile statistics to this file and print the top functions")
+    parser.add_argument("--sample", type=float, help="sample the search stack every that many seconds")
+    args = parser.parse_args()
+
+    if args.fen is not None:
+        fens = {"fen": args.fen}
+    elif args.position is not None:
+        fens = {args.position: POSITIONS[args.position][0]}
+    else:
+        fens = {name: fen for name, (fen, _) in POSITIONS.items()}
+    allStats = {}
+    for name, fen in fens.items():
+        gs = newGameState(fen, args.bitboard)
+        tt = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_SIZE_MB)  # every position from scratch
+        profilePath = args.profile + "." + name if args.profile is not None and len(fens) > 1 else args.profile
+        result, stats = searchWithStats(gs, args.depth, args.time, tt, profilePath=profilePath,
+                                        sampleInterval=args.sample)
+        print("%s: best %s score %d depth %d" % (name, result.move, result.score, result.depth))
+        stats.report()
+        if profilePath is not None:
+            pstats.Stats(profilePath).sort_stats("tottime").print_stats(15)
+        allStats[name] = stats.toDict()
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(allStats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,95 @@
 import random
+import time
 
-pieceScore = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-CHECKMATE = 1000
+import MoveOrdering
+import OpeningBook
+import PawnStructure
+import Tablebase
+import TranspositionTable
+from PieceSquareTables import PIECE_VALUES_EG, PIECE_POINTS
+
+pieceScore = PIECE_POINTS
+CHECKMATE = 100000
 STALEMATE = 0
+DEPTH = 3
+MAX_PLY = 64
+MATE_THRESHOLD = CHECKMATE - MAX_PLY - Tablebase.MAX_PLIES  # scores beyond this are forced mates, also from tablebases
+INFINITY = CHECKMATE + 1
+ASPIRATION_WINDOW = 50  # centipawns on either side of the last iteration's score
+DELTA_MARGIN = 200  # centipawns of positional slack before a capture is considered hopeless in quiescence search
+TT_SIZE_MB = 16
+
+transpositionTable = TranspositionTable.TranspositionTable(TT_SIZE_MB)  # kept between moves of a game
+pawnCache = PawnStructure.PawnCache()  # pawn structure scores, kept between moves and games
+openingBook = None  # OpeningBook.OpeningBook set by loadOpeningBook, findBestMove plays its moves without searching
+
+
+def loadOpeningBook(path, mode="weighted"):
+    global openingBook
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = OpeningBook.OpeningBook(path, mode) if path is not None else None
+
+
+"""
+Move from the opening book for the position, None if there is no book or the position is not in it
+"""
+
+
+def findBookMove(gs, validMoves):
+    if openingBook is None:
+        return None
+    return openingBook.findMove(gs, validMoves)
+
+
+tablebases = None  # Tablebase.Tablebases set by loadTablebases, the search reads endgames with few pieces from them
+
+
+def loadTablebases(directory=Tablebase.TABLE_DIR):
+    global tablebases
+    if tablebases is not None:
+        tablebases.close()
+    tablebases = Tablebase.Tablebases(directory) if directory is not None else None
+
+
+"""
+Exact score of the position from the tablebases for the side to move, mates counted in plies from the root like the
+search does. None if there are no tablebases or the position is not in them.
+"""
+
+
+def tablebaseScore(gs, ply):
+    result = tablebases.probe(gs) if tablebases is not None else None
+    if result is None:
+        return None
+    outcome, plies = result
+    if outcome == Tablebase.WIN:
+        return CHECKMATE - ply - plies
+    if outcome == Tablebase.LOSS:
+        return -(CHECKMATE - ply - plies)
+    return STALEMATE
+
+
+"""
+Best of rootMoves by the tablebase scores of the positions they lead to, None unless every one of them is in the
+tablebases
+"""
+
+
+def tablebaseRootResult(gs, rootMoves):
+    start = time.perf_counter()
+    bestMove = None
+    bestScore = -INFINITY
+    for move in rootMoves:
+        gs.makeMove(move)
+        score = tablebaseScore(gs, 1)
+        gs.undoMove()
+        if score is None:
+            return None
+        if -score > bestScore:
+            bestScore = -score
+            bestMove = move
+    return SearchResult(bestMove, bestScore, [bestMove], 0, len(rootMoves), time.perf_counter() - start)
 
 
 def findRandomMove(validMoves):
@@ -31,33 +118,292 @@ def findGreedyMove(gs, validMoves):
     return bestMove
 
 
-# DEBUG LATER
-def findBestMove(gs, validMoves):
-    turnMultiplier = 1 if gs.whiteToMove else -1
-    opponentMinMaxScore = CHECKMATE
-    bestPlayerMove = None
-    # random.shuffle(validMoves)
+"""
+Play from the opening book while the position is in it, otherwise search the position to the given depth. Returns the
+best of validMoves, None if there are no moves
+"""
 
-    for playerMove in validMoves:
-        gs.makeMove(playerMove)
-        opponentMoves = gs.getValidMoves()
-        opponentMaxScore = -CHECKMATE
-        for opponentMove in opponentMoves:
-            gs.makeMove(opponentMove)
-            if gs.checkMate:
-                score = - turnMultiplier * CHECKMATE
-            elif gs.staleMate:
-                score = 0
+
+def findBestMove(gs, validMoves, depth=DEPTH, tt=None):
+    bookMove = findBookMove(gs, validMoves)
+    if bookMove is not None:
+        return bookMove
+    return searchBestMove(gs, depth, tt=tt, validMoves=validMoves).move
+
+
+"""
+The search entry point. Iterative deepening negamax with alpha-beta and principal variation search, searching each
+depth with an aspiration window around the score of the depth before. Stops early after timeLimit seconds, or as soon
+as stopEvent (anything with an is_set method, like threading.Event) is set, and then answers with the deepest finished
+iteration. With tablebases loaded and few enough pieces on the board the root moves are scored straight from the
+tables instead. Returns a SearchResult.
+"""
+
+
+def searchBestMove(gs, depth=DEPTH, timeLimit=None, tt=None, validMoves=None, stopEvent=None, onIteration=None):
+    if tablebases is not None:
+        result = tablebaseRootResult(gs, gs.getValidMoves() if validMoves is None else validMoves)
+        if result is not None and result.move is not None:
+            return result
+    search = Search(gs, transpositionTable if tt is None else tt, timeLimit, stopEvent, onIteration)
+    return search.iterativeDeepening(depth, validMoves)
+
+
+class SearchResult:
+    def __init__(self, move, score, pv, depth, nodes, seconds, firstMoveCutoffRate=0.0):
+        self.move = move  # best move, None if there is no legal move
+        self.score = score  # from the point of view of the side to move
+        self.pv = pv  # principal variation, the line of best play starting with move
+        self.depth = depth  # deepest finished iteration
+        self.nodes = nodes
+        self.seconds = seconds
+        self.firstMoveCutoffRate = firstMoveCutoffRate  # share of beta cutoffs caused by the first move searched
+
+
+class Search:
+    def __init__(self, gs, tt, timeLimit=None, stopEvent=None, onIteration=None):
+        self.gs = gs
+        self.tt = tt
+        self.timeLimit = timeLimit
+        self.stopEvent = stopEvent
+        self.onIteration = onIteration  # called with the SearchResult of every finished depth
+        self.deadline = None
+        self.stopped = False
+        self.nodes = 0
+        self.orderer = MoveOrdering.MoveOrderer(MAX_PLY)
+        self.pvTable = [[] for _ in range(MAX_PLY + 1)]  # pvTable[ply] is the best line found from that ply on
+
+    def iterativeDeepening(self, maxDepth, rootMoves=None):
+        gs = self.gs
+        startTime = time.perf_counter()
+        if self.timeLimit is not None:
+            self.deadline = startTime + self.timeLimit
+        self.tt.newSearch()
+        if rootMoves is None:
+            rootMoves = gs.getValidMoves()
+        rootMoves = self.orderer.orderMoves(list(rootMoves), 0)
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, rootMoves[:1], 0, 0, 0.0)
+        if len(rootMoves) <= 1:  # nothing to think about
+            return result
+        score = 0
+        for depth in range(1, maxDepth + 1):
+            if depth == 1:
+                alpha, beta = -INFINITY, INFINITY
             else:
-                score = -turnMultiplier * scoreMaterial(gs.board)
-            if score > opponentMinMaxScore:
-                opponentMinMaxScore = score
+                alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+            while True:
+                score = self.searchRoot(rootMoves, depth, alpha, beta)
+                if self.stopped:
+                    break
+                if score <= alpha:  # failed low, open the window downwards and search again
+                    alpha = -INFINITY
+                elif score >= beta:  # failed high, open the window upwards and search again
+                    beta = INFINITY
+                else:
+                    break
+            if self.stopped:
+                break
+            pv = self.pvTable[0]
+            rootMoves.remove(pv[0])  # search the best move first in the next iteration
+            rootMoves.insert(0, pv[0])
+            result = SearchResult(pv[0], score, list(pv), depth, self.nodes, time.perf_counter() - startTime)
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if abs(score) >= MATE_THRESHOLD:  # found a forced mate, deeper searches can't improve on it
+                break
+        result.nodes = self.nodes
+        result.firstMoveCutoffRate = self.orderer.firstMoveCutoffRate()
+        result.seconds = time.perf_counter() - startTime
+        return result
+
+    def searchRoot(self, rootMoves, depth, alpha, beta):
+        gs = self.gs
+        self.nodes += 1
+        bestScore = -INFINITY
+        bestMove = None
+        alphaOriginal = alpha
+        for i, move in enumerate(rootMoves):
+            gs.makeMove(move)
+            if i == 0:
+                score = -self.negaMax(depth - 1, -beta, -alpha, 1)
+            else:  # prove with a null window that the move is worse than the best so far, search it fully if not
+                score = -self.negaMax(depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self.negaMax(depth - 1, -beta, -alpha, 1)
             gs.undoMove()
-        if opponentMaxScore < opponentMinMaxScore:
-            opponentMinMaxScore = opponentMaxScore
-            bestPlayerMove = playerMove
-        gs.undoMove()
-    return bestPlayerMove
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[0] = [move] + self.pvTable[1]
+                    if alpha >= beta:
+                        self.orderer.recordCutoff(move, depth, 0, i)
+                        break
+        if bestScore <= alphaOriginal:  # nothing raised alpha, keep the first move as the line to play
+            self.pvTable[0] = [rootMoves[0]]
+        self.storeScore(gs.zobristKey, depth, bestScore, alphaOriginal, beta, bestMove, 0)
+        return bestScore
+
+    """
+    Score of the position for the side to move searched depth plies deep. The result is exact inside (alpha, beta),
+    an upper bound if it is <= alpha and a lower bound if it is >= beta.
+    """
+
+    def negaMax(self, depth, alpha, beta, ply):
+        gs = self.gs
+        self.nodes += 1
+        self.pvTable[ply] = []
+        if self.nodes & 1023 == 0:
+            self.checkTime()
+        if tablebases is not None:
+            score = tablebaseScore(gs, ply)
+            if score is not None:
+                return score
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+        if ply >= MAX_PLY:
+            return scoreBoard(gs)
+
+        key = gs.zobristKey
+        entry = self.tt.probe(key)
+        hashMoveID = None
+        if entry is not None:
+            entryDepth, entryScore, bound, hashMoveID = entry
+            if entryDepth >= depth:
+                entryScore = scoreFromTable(entryScore, ply)
+                if bound == TranspositionTable.EXACT or \
+                        (bound == TranspositionTable.LOWER_BOUND and entryScore >= beta) or \
+                        (bound == TranspositionTable.UPPER_BOUND and entryScore <= alpha):
+                    return entryScore
+
+        # moves are generated in stages as they are needed: the hash move, captures, then quiet moves
+        moves = gs.generateMoves(hashMoveID, lambda stage: self.orderer.orderMoves(stage, ply))
+        bestScore = -INFINITY
+        bestMove = None
+        alphaOriginal = alpha
+        for i, move in enumerate(moves):
+            gs.makeMove(move)
+            if i == 0:
+                score = -self.negaMax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negaMax(depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negaMax(depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if alpha >= beta:  # beta cutoff, the opponent won't allow this position
+                        self.orderer.recordCutoff(move, depth, ply, i)
+                        break
+        if bestMove is None:  # no legal move
+            return -(CHECKMATE - ply) if gs.inCheck else STALEMATE  # mates closer to the root score higher
+        self.storeScore(key, depth, bestScore, alphaOriginal, beta, bestMove, ply)
+        return bestScore
+
+    """
+    Capture-only search at the leaves so a position is never scored in the middle of an exchange. The side to move may
+    stand pat on the static score instead of capturing, captures that can't bring the score back up to alpha even after
+    winning the piece are skipped (delta pruning). In check every evasion is searched.
+    """
+
+    def quiescence(self, alpha, beta, ply):
+        gs = self.gs
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkTime()
+        standPat = scoreBoard(gs)
+        if ply >= MAX_PLY:
+            return standPat
+        inCheck = gs.kingInCheck()
+        if inCheck:  # generated once, every evasion in check and only the captures otherwise
+            moves = gs.getLegalMoves()
+            if len(moves) == 0:
+                return -(CHECKMATE - ply)
+            bestScore = -INFINITY
+        else:
+            if standPat >= beta:
+                return standPat
+            if standPat + PIECE_VALUES_EG['Q'] + DELTA_MARGIN <= alpha:  # not even winning a queen would help
+                return standPat
+            moves = gs.getValidCaptures()
+            if standPat > alpha:
+                alpha = standPat
+            bestScore = standPat
+        self.orderer.orderMoves(moves, ply)
+        for move in moves:
+            if not inCheck and not move.pawnPromotion and \
+                    standPat + PIECE_VALUES_EG[move.pieceCaptured[1]] + DELTA_MARGIN <= alpha:
+                continue
+            gs.makeMove(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+    def storeScore(self, key, depth, score, alphaOriginal, beta, bestMove, ply):
+        if score <= alphaOriginal:
+            bound = TranspositionTable.UPPER_BOUND
+        elif score >= beta:
+            bound = TranspositionTable.LOWER_BOUND
+        else:
+            bound = TranspositionTable.EXACT
+        self.tt.store(key, depth, scoreToTable(score, ply), bound, bestMove.moveID)
+
+    def checkTime(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        elif self.stopEvent is not None and self.stopEvent.is_set():
+            self.stopped = True
+
+
+"""
+Mate scores count plies from the root. The table stores them counted from the position itself so they stay right when
+the position is reached at a different ply.
+"""
+
+
+def scoreToTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+"""
+Score of the position in centipawns for the side to move. Material and piece-square tables tapered by game phase, kept
+up to date incrementally by the GameState, plus the pawn structure from the pawn cache, so this is two lookups, not a
+board scan.
+"""
+
+
+def scoreBoard(gs):
+    score = gs.getEvaluation() + pawnCache.getScore(gs)
+    return score if gs.whiteToMove else -score
 
 
 """
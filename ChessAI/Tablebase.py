@@ -0,0 +1,341 @@
+"""
+Endgame tablebases for positions with only a few pieces, like KQ v K, KR v K and KP v K. The generator goes through
+every placement of the pieces with either side to move, finds the checkmates and stalemates with GameState move
+generation and then works backwards from the mates: a position is won in n + 1 plies if one move reaches a position
+lost in n plies, and lost in n + 1 plies once every move reaches a position the opponent wins, the slowest in n.
+Captures and promotions leave the table, their results come from the smaller tables or are draws by insufficient
+material, so those tables have to be generated first.
+
+A table is a file with one signed byte per position, found by its index, no header: 0 for a draw (and for positions
+that can't happen), plies to mate + 1 when the side to move wins, -(plies to mate + 1) when it loses. The index is
+side to move * 64^n plus the square of each piece in signature order as the digits of a base 64 number. Tables are
+memory mapped, so probing one is a byte read and processes share the pages.
+Only tables with white as the stronger side are stored, positions with black stronger are probed with colors flipped.
+
+python Tablebase.py              generate KQvK, KRvK and KPvK into the tablebases folder
+The tables are generated files and not kept in git, run the line above once after checking out.
+python Tablebase.py KRvK KQvKR   generate the given signatures, smaller ones they need must exist already
+4 piece tables work the same way but take hours and gigabytes in Python, 3 pieces take a minute or two each.
+"""
+
+import array
+import itertools
+import mmap
+import os
+import sys
+import time
+
+import ChessEngine
+from PieceSquareTables import PHASE_WEIGHTS
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+DEFAULT_SIGNATURES = ("KQvK", "KRvK", "KPvK")
+MAX_PIECES = 4
+MAX_PLIES = 126  # longest mate a byte can hold
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+PIECE_ORDER = "KQRBNP"  # order of the pieces in a signature
+PIECE_VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+INSUFFICIENT = ("KvK", "KBvK", "KNvK")  # no table needed, nobody can mate
+
+
+def _sideSignature(letters):
+    return "".join(sorted(letters, key=PIECE_ORDER.index))
+
+
+"""
+(signature, flipped) of the material on the board, flipped is True when black is the stronger side and the position
+has to be probed with the colors swapped. None if there are more than MAX_PIECES pieces.
+"""
+
+
+def materialSignature(board):
+    if sum(row.count("--") for row in board) < 64 - MAX_PIECES:
+        return None
+    white = []
+    black = []
+    for row in board:
+        for square in row:
+            if square != "--":
+                (white if square[0] == 'w' else black).append(square[1].upper())
+    white = _sideSignature(white)
+    black = _sideSignature(black)
+    flipped = (sum(PIECE_VALUES[p] for p in black), black) > (sum(PIECE_VALUES[p] for p in white), white)
+    if flipped:
+        white, black = black, white
+    return white + "v" + black, flipped
+
+
+"""
+Pieces of a signature in index order, as board strings: "KPvK" is ['wK', 'wp', 'bK']
+"""
+
+
+def signaturePieces(signature):
+    white, black = signature.split("v")
+    return [color + (p if p != "P" else "p") for color, side in (("w", white), ("b", black)) for p in side]
+
+
+def tableSize(signature):
+    return 2 * 64 ** len(signaturePieces(signature))
+
+
+def encodeValue(result, plies):
+    if result == DRAW:
+        return 0
+    return (plies + 1) if result == WIN else -(plies + 1)
+
+
+def decodeValue(value):
+    if value == 0:
+        return DRAW, 0
+    return (WIN, value - 1) if value > 0 else (LOSS, -value - 1)
+
+
+"""
+Index of the position in the table of its signature. Squares of identical pieces are taken in increasing order.
+"""
+
+
+def positionIndex(board, whiteToMove, pieces, flipped=False):
+    squares = {}
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                if flipped:
+                    piece = ('b' if piece[0] == 'w' else 'w') + piece[1]
+                    squares.setdefault(piece, []).append((7 - r) * 8 + c)
+                else:
+                    squares.setdefault(piece, []).append(r * 8 + c)
+    for pieceSquares in squares.values():
+        pieceSquares.sort()
+    index = 0 if whiteToMove != flipped else 1
+    taken = {}
+    for piece in pieces:
+        i = taken.get(piece, 0)
+        taken[piece] = i + 1
+        index = index * 64 + squares[piece][i]
+    return index
+
+
+"""
+The signatures that have no complete table file in directory
+"""
+
+
+def missingTables(directory=TABLE_DIR, signatures=DEFAULT_SIGNATURES):
+    return [signature for signature in signatures
+            if not os.path.isfile(os.path.join(directory, signature + ".tb")) or
+            os.path.getsize(os.path.join(directory, signature + ".tb")) != tableSize(signature)]
+
+
+class Tablebases:
+    def __init__(self, directory=TABLE_DIR):
+        self.directory = directory
+        self.tables = {}  # signature -> mmap of its file, None if there is no file
+
+    def table(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, signature + ".tb")
+            table = None
+            if os.path.isfile(path) and os.path.getsize(path) == tableSize(signature):
+                with open(path, "rb") as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.tables[signature] = table
+        return self.tables[signature]
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+    """
+    (WIN, DRAW or LOSS for the side to move, plies to mate) of the position, None if it has too many pieces, castle
+    rights or an en passant capture, or its table is missing
+    """
+
+    def probe(self, gs):
+        if gs.evaluationLog[-1][2] > (MAX_PIECES - 2) * PHASE_WEIGHTS['Q']:  # quick out, too many pieces left
+            return None
+        material = materialSignature(gs.board)
+        if material is None or gs.castleRightsIndex() or _enPassantCapture(gs):
+            return None
+        signature, flipped = material
+        if signature in INSUFFICIENT:
+            return DRAW, 0
+        table = self.table(signature)
+        if table is None:
+            return None
+        value = table[positionIndex(gs.board, gs.whiteToMove, signaturePieces(signature), flipped)]
+        return decodeValue(value - 256 if value > 127 else value)
+
+
+"""
+True if the side to move has a pawn that can capture en passant, the tables don't know about those captures
+"""
+
+
+def _enPassantCapture(gs):
+    if not gs.enPassantPossible:
+        return False
+    epRow, epCol = gs.enPassantPossible
+    pawnRow = epRow + 1 if gs.whiteToMove else epRow - 1
+    pawn = "wp" if gs.whiteToMove else "bp"
+    return any(0 <= c <= 7 and gs.board[pawnRow][c] == pawn for c in (epCol - 1, epCol + 1))
+
+
+"""
+Positions of the signature, (index, board, whiteToMove), skipping placements that can't happen: two pieces on one
+square, pawns on the first or last rank, kings next to each other. Identical pieces only in increasing square order.
+"""
+
+
+def _placements(pieces):
+    n = len(pieces)
+    whiteKing, blackKing = pieces.index("wK"), pieces.index("bK")
+    for squares in itertools.product(range(64), repeat=n):
+        if len(set(squares)) < n:
+            continue
+        if any(pieces[i] == pieces[i - 1] and squares[i] < squares[i - 1] for i in range(1, n)):
+            continue
+        if any(piece[1] == 'p' and squares[i] // 8 in (0, 7) for i, piece in enumerate(pieces)):
+            continue
+        wr, wc = divmod(squares[whiteKing], 8)
+        br, bc = divmod(squares[blackKing], 8)
+        if abs(wr - br) <= 1 and abs(wc - bc) <= 1:
+            continue
+        board = [["--"] * 8 for _ in range(8)]
+        for piece, sq in zip(pieces, squares):
+            board[sq // 8][sq % 8] = piece
+        index = 0
+        for sq in squares:
+            index = index * 64 + sq
+        yield index, board, True
+        yield 64 ** n + index, board, False
+
+
+def _setPosition(gs, board, whiteToMove):
+    rows = []
+    for row in board:
+        text = ""
+        empty = 0
+        for square in row:
+            if square == "--":
+                empty += 1
+                continue
+            if empty:
+                text += str(empty)
+                empty = 0
+            letter = square[1].upper() if square[1] != 'p' else 'P'
+            text += letter if square[0] == 'w' else letter.lower()
+        rows.append(text + (str(empty) if empty else ""))
+    gs.loadFen("/".join(rows) + (" w" if whiteToMove else " b") + " - - 0 1")
+
+
+"""
+Generate the table of a signature and write it to directory. Needs the tables of everything a capture or promotion
+can lead to. Returns the number of won, drawn and lost positions.
+"""
+
+
+def generate(signature, directory=TABLE_DIR, verbose=True):
+    start = time.perf_counter()
+    pieces = signaturePieces(signature)
+    size = tableSize(signature)
+    tablebases = Tablebases(directory)
+    gs = ChessEngine.GameState()
+    values = array.array('b', bytes(size))
+    resolved = bytearray(size)
+    remaining = array.array('H', bytes(2 * size))  # moves not yet known to lose, a position with none left is lost
+    parents = array.array('I')  # internal moves as (parent, child) pairs, flattened
+    children = array.array('I')
+    levels = [[] for _ in range(MAX_PLIES + 2)]  # level n: (position, is a loss) resolved with mate in n plies
+    external = [[] for _ in range(MAX_PLIES + 2)]  # level n: (parent, child is a loss) of moves leaving the table
+    positions = 0
+
+    for index, board, whiteToMove in _placements(pieces):
+        _setPosition(gs, board, whiteToMove)
+        otherKing = gs.blackKingLocation if whiteToMove else gs.whiteKingLocation
+        if gs.squareUnderAttack(otherKing[0], otherKing[1], 'b' if whiteToMove else 'w'):
+            resolved[index] = 1  # the side that just moved left its king in check
+            continue
+        positions += 1
+        moves = gs.getValidMoves()
+        if not moves:
+            resolved[index] = 1
+            if gs.checkMate:
+                values[index] = encodeValue(LOSS, 0)
+                levels[0].append((index, True))
+            continue
+        remaining[index] = len(moves)
+        for move in moves:
+            if move.pieceCaptured != "--" or move.pawnPromotion:
+                gs.makeMove(move)
+                result = tablebases.probe(gs)
+                if result is None:
+                    raise ValueError("%s needs the table of %s, generate it first" %
+                                     (signature, materialSignature(gs.board)[0]))
+                gs.undoMove()
+                childResult, plies = result
+                if childResult != DRAW:
+                    external[plies].append((index, childResult == LOSS))
+            else:
+                gs.board[move.startRow][move.startCol] = "--"  # the child's index from the board after the move
+                gs.board[move.endRow][move.endCol] = move.pieceMoved
+                parents.append(index)
+                children.append(positionIndex(gs.board, not whiteToMove, pieces))
+                gs.board[move.endRow][move.endCol] = "--"
+                gs.board[move.startRow][move.startCol] = move.pieceMoved
+    tablebases.close()
+
+    # predecessors of every position, the parents sorted by child
+    counts = array.array('I', bytes(4 * (size + 1)))
+    for child in children:
+        counts[child + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+    predecessors = array.array('I', bytes(4 * len(parents)))
+    fill = array.array('I', counts)
+    for parent, child in zip(parents, children):
+        predecessors[fill[child]] = parent
+        fill[child] += 1
+    del parents, children, fill
+
+    for plies in range(MAX_PLIES + 1):
+        events = [(parent, isLoss) for parent, isLoss in external[plies]]
+        for position, isLoss in levels[plies]:
+            events.extend((predecessors[i], isLoss) for i in range(counts[position], counts[position + 1]))
+        for parent, childLost in events:
+            if resolved[parent]:
+                continue
+            if childLost:  # a move to a lost position wins
+                resolved[parent] = 1
+                values[parent] = encodeValue(WIN, plies + 1)
+                levels[plies + 1].append((parent, False))
+            else:
+                remaining[parent] -= 1
+                if remaining[parent] == 0:  # every move loses, the slowest in plies
+                    resolved[parent] = 1
+                    values[parent] = encodeValue(LOSS, plies + 1)
+                    levels[plies + 1].append((parent, True))
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, signature + ".tb"), "wb") as f:
+        values.tofile(f)
+    wins = sum(1 for value in values if value > 0)
+    losses = sum(1 for value in values if value < 0)
+    if verbose:
+        print("%s: %d positions, %d won, %d lost, %d drawn, longest mate %d plies, %.1fs" %
+              (signature, positions, wins, losses, positions - wins - losses,
+               max(abs(value) - 1 for value in values), time.perf_counter() - start))
+    return wins, positions - wins - losses, losses
+
+
+if __name__ == "__main__":
+    for signature in sys.argv[1:] or DEFAULT_SIGNATURES:
+        generate(signature)
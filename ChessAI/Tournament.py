@@ -0,0 +1,255 @@
+"""
+Plays engines against each other without the pygame window, many games at a time in a process pool. Every game starts
+with a few random plies so games differ, and every opening is played twice with the colors swapped. Finished games are
+appended to a PGN file as they come in, at the end the score of the first player against the second is printed with
+the Elo difference it stands for and an SPRT verdict.
+
+Players are given as name or name:argument, see PLAYERS:
+random, greedy, best:<depth>, time:<seconds>
+python Tournament.py best:3 greedy -n 100 -j 4 --pgn games.pgn
+python Tournament.py best:4 best:3 -n 1000 --elo0 0 --elo1 20  stop once the SPRT accepts either hypothesis
+"""
+
+import argparse
+import datetime
+import math
+import multiprocessing
+import os
+import random
+
+import ChessEngine
+import SmartMoveFinder
+import Tablebase
+import TranspositionTable
+
+MAX_PLIES = 400  # games still running after this many plies are adjudicated drawn
+
+
+def _searchPlayer(depth):
+    tt = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_SIZE_MB)  # own table, don't share with the opponent
+    return lambda gs, validMoves: SmartMoveFinder.findBestMove(gs, validMoves, depth, tt)
+
+
+def _timedPlayer(seconds):
+    tt = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_SIZE_MB)
+    return lambda gs, validMoves: SmartMoveFinder.searchBestMove(gs, SmartMoveFinder.MAX_PLY, seconds, tt,
+                                                                 validMoves).move
+
+
+# name -> function of the argument after the colon (None without one) that returns a move chooser
+# chooser(gs, validMoves) -> one of validMoves. Add new searches here to play them in tournaments.
+PLAYERS = {
+    "random": lambda arg: lambda gs, validMoves: SmartMoveFinder.findRandomMove(validMoves),
+    "greedy": lambda arg: lambda gs, validMoves: SmartMoveFinder.findGreedyMove(gs, validMoves),
+    "best": lambda arg: _searchPlayer(int(arg) if arg else SmartMoveFinder.DEPTH),
+    "time": lambda arg: _timedPlayer(float(arg) if arg else 1.0),
+}
+
+
+def makePlayer(spec):
+    name, _, arg = spec.partition(":")
+    if name not in PLAYERS:
+        raise ValueError("unknown player %s, choose from %s" % (spec, ", ".join(sorted(PLAYERS))))
+    return PLAYERS[name](arg or None)
+
+
+"""
+(result, termination) if the game is over, result "1-0", "0-1" or "1/2-1/2", None while it goes on
+"""
+
+
+def gameOver(gs, validMoves):
+    if not validMoves:
+        if gs.inCheck:
+            return ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if gs.zobristLog.count(gs.zobristKey) >= 3:
+        return "1/2-1/2", "threefold repetition"
+    if gs.halfmoveClock >= 100:
+        return "1/2-1/2", "fifty move rule"
+    material = Tablebase.materialSignature(gs.board)
+    if material is not None and material[0] in Tablebase.INSUFFICIENT:
+        return "1/2-1/2", "insufficient material"
+    if len(gs.moveLog) >= MAX_PLIES:
+        return "1/2-1/2", "adjudicated after %d plies" % MAX_PLIES
+    return None
+
+
+"""
+Play one game, the first openingPlies plies are random moves picked with seed. Returns a dict with the players, the
+SAN moves, the result and how the game ended.
+"""
+
+
+def playGame(game, white, black, seed, openingPlies=4):
+    random.seed("%d-%d" % (seed, game))  # the random players replay the same game for the same seed
+    openingRandom = random.Random(seed)
+    players = {True: makePlayer(white), False: makePlayer(black)}
+    gs = ChessEngine.GameState()
+    sanMoves = []
+    while True:
+        validMoves = gs.getValidMoves()
+        over = gameOver(gs, validMoves)
+        if over is not None:
+            break
+        if len(gs.moveLog) < openingPlies:
+            move = openingRandom.choice(validMoves)
+        else:
+            move = players[gs.whiteToMove](gs, validMoves)
+            if move is None or move not in validMoves:  # a broken player loses nothing but the move choice
+                move = openingRandom.choice(validMoves)
+        sanMoves.append(gs.getSAN(move))
+        gs.makeMove(move)
+    return {"game": game, "white": white, "black": black, "moves": sanMoves, "result": over[0],
+            "termination": over[1]}
+
+
+def _playGame(task):
+    return playGame(*task)
+
+
+def toPGN(game, event="ChessAI tournament"):
+    headers = [("Event", event), ("Site", "?"), ("Date", datetime.date.today().strftime("%Y.%m.%d")),
+               ("Round", str(game["game"] + 1)), ("White", game["white"]), ("Black", game["black"]),
+               ("Result", game["result"]), ("Termination", game["termination"]),
+               ("PlyCount", str(len(game["moves"])))]
+    lines = ['[%s "%s"]' % header for header in headers]
+    tokens = []
+    for i, san in enumerate(game["moves"]):
+        if i % 2 == 0:
+            tokens.append("%d." % (i // 2 + 1))
+        tokens.append(san)
+    tokens.append(game["result"])
+    movetext = ""
+    line = ""
+    for token in tokens:  # PGN lines stay below 80 characters
+        if len(line) + len(token) + 1 > 79:
+            movetext += line + "\n"
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append("")
+    lines.append(movetext + line)
+    return "\n".join(lines) + "\n\n"
+
+
+"""
+Expected score of a player rated elo points above its opponent
+"""
+
+
+def expectedScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+"""
+(Elo difference, 95% error margin) of a score of wins, draws and losses, None for the margin when it can't be told
+"""
+
+
+def eloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return (math.inf if score >= 1 else -math.inf), None
+    elo = -400 * math.log10(1 / score - 1)
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    low = score - 1.96 * deviation / math.sqrt(games)
+    high = score + 1.96 * deviation / math.sqrt(games)
+    if low <= 0 or high >= 1:
+        return elo, None
+    return elo, (-400 * math.log10(1 / high - 1) + 400 * math.log10(1 / low - 1)) / 2
+
+
+"""
+Log likelihood ratio of the results for H1: elo = elo1 against H0: elo = elo0, with the trinomial normal
+approximation. The test accepts H1 once it passes upper and H0 once it drops below lower.
+"""
+
+
+def sprt(wins, draws, losses, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+    if games == 0 or wins + losses == 0:
+        return 0.0, lower, upper
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    if variance <= 0:
+        return 0.0, lower, upper
+    score0, score1 = expectedScore(elo0), expectedScore(elo1)
+    llr = (score1 - score0) * (2 * score - score0 - score1) / (2 * variance / games)
+    return llr, lower, upper
+
+
+"""
+Play games between first and second, the first plays white in the even games. Games are written to pgnPath as they
+finish. Stops early when elo0 and elo1 are given and the SPRT is decided. Returns (wins, draws, losses) of first.
+"""
+
+
+def runTournament(first, second, games=100, workers=os.cpu_count() or 1, pgnPath="tournament.pgn", seed=1,
+                  openingPlies=4, elo0=None, elo1=None):
+    makePlayer(first)  # fail now on a misspelled player, not in every worker
+    makePlayer(second)
+    tasks = []
+    for game in range(games):
+        white, black = (first, second) if game % 2 == 0 else (second, first)
+        tasks.append((game, white, black, seed + game // 2, openingPlies))  # both colors of each opening
+    wins = draws = losses = 0
+    with open(pgnPath, "a") as pgn, multiprocessing.Pool(workers) as pool:
+        for game in pool.imap_unordered(_playGame, tasks):
+            pgn.write(toPGN(game))
+            pgn.flush()
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == first):
+                wins += 1
+            else:
+                losses += 1
+            played = wins + draws + losses
+            print("game %4d  %-12s - %-12s %-7s %-28s  +%d =%d -%d" %
+                  (game["game"] + 1, game["white"], game["black"], game["result"], game["termination"],
+                   wins, draws, losses))
+            if elo0 is not None and elo1 is not None and played >= 2:
+                llr, lower, upper = sprt(wins, draws, losses, elo0, elo1)
+                if llr >= upper or llr <= lower:
+                    pool.terminate()
+                    break
+    return wins, draws, losses
+
+
+def printSummary(first, second, wins, draws, losses, elo0=0.0, elo1=10.0):
+    games = wins + draws + losses
+    print("%s vs %s: %d games, +%d =%d -%d, score %.1f%%" %
+          (first, second, games, wins, draws, losses, 100 * (wins + draws / 2) / games if games else 0))
+    if games == 0:
+        return
+    elo, margin = eloDifference(wins, draws, losses)
+    print("Elo difference: %+.1f %s" % (elo, "+/- %.1f" % margin if margin is not None else "(margin unknown)"))
+    llr, lower, upper = sprt(wins, draws, losses, elo0, elo1)
+    verdict = "H1 accepted" if llr >= upper else "H0 accepted" if llr <= lower else "inconclusive"
+    print("SPRT elo0=%g elo1=%g: LLR %.2f (%.2f, %.2f) %s" % (elo0, elo1, llr, lower, upper, verdict))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engines against each other without the window.")
+    parser.add_argument("first", help="player to test, e.g. best:3")
+    parser.add_argument("second", help="opponent, e.g. greedy")
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pgn", default="tournament.pgn", help="games are appended to this file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--opening-plies", type=int, default=4, help="random plies at the start of every game")
+    parser.add_argument("--elo0", type=float, help="SPRT H0, with --elo1 the run stops once the test is decided")
+    parser.add_argument("--elo1", type=float)
+    args = parser.parse_args()
+
+    wins, draws, losses = runTournament(args.first, args.second, args.games, args.workers, args.pgn, args.seed,
+                                        args.opening_plies, args.elo0, args.elo1)
+    printSummary(args.first, args.second, wins, draws, losses,
+                 args.elo0 if args.elo0 is not None else 0.0, args.elo1 if args.elo1 is not None else 10.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Fixed size transposition table for the search. Positions are looked up by their Zobrist key. Every entry remembers the
+depth it was searched to, the score, whether that score is exact or only a lower or upper bound, and the moveID of the
+best move found. The table is split into buckets of two slots: the first slot keeps the deepest search of the current
+game (depth preferred), the second slot always takes the newest entry that did not make it into the first one.
+"""
+
+EXACT = 0
+LOWER_BOUND = 1  # search failed high, real score is at least this
+UPPER_BOUND = 2  # search failed low, real score is at most this
+
+# rough bytes one slot costs in CPython: the key int, the entry tuple with its ints and two list pointers
+ENTRY_BYTES = 160
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=16):
+        buckets = 1
+        while buckets * 2 * 2 * ENTRY_BYTES <= sizeMB * 1024 * 1024:  # largest power of two that fits
+            buckets *= 2
+        self.sizeMB = sizeMB
+        self.mask = buckets - 1
+        self.keys = [0] * (buckets * 2)  # slot 2 * i is depth preferred, slot 2 * i + 1 always replace
+        self.entries = [None] * (buckets * 2)  # (depth, score, bound, moveID, generation)
+        self.generation = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0  # probes that found a different position in the bucket
+        self.overwrites = 0  # stores that threw out a different position
+
+    """
+    Start of a new search, entries of older searches may now be replaced by shallower ones
+    """
+
+    def newSearch(self):
+        self.generation += 1
+
+    def clear(self):
+        self.keys = [0] * len(self.keys)
+        self.entries = [None] * len(self.entries)
+        self.generation = 0
+        self.resetStats()
+
+    """
+    Returns (depth, score, bound, moveID) stored for the key or None
+    """
+
+    def probe(self, key):
+        self.probes += 1
+        slot = (key & self.mask) * 2
+        keys = self.keys
+        if keys[slot] != key:
+            slot += 1
+            if keys[slot] != key:
+                if self.entries[slot - 1] is not None:
+                    self.collisions += 1
+                return None
+        entry = self.entries[slot]
+        if entry is None:  # key 0 in an empty slot
+            return None
+        self.hits += 1
+        return entry[:4]
+
+    def store(self, key, depth, score, bound, moveID):
+        self.stores += 1
+        slot = (key & self.mask) * 2
+        old = self.entries[slot]
+        if old is not None and self.keys[slot] != key and old[0] > depth and old[4] == self.generation:
+            slot += 1  # keep the deeper entry of this search, use the always replace slot
+            old = self.entries[slot]
+        if old is not None and self.keys[slot] != key:
+            self.overwrites += 1
+        self.keys[slot] = key
+        self.entries[slot] = (depth, score, bound, moveID, self.generation)
+
+    """
+    Best move stored for the key or None, used to search that move first
+    """
+
+    def getMoveID(self, key):
+        slot = (key & self.mask) * 2
+        if self.keys[slot] == key and self.entries[slot] is not None:
+            return self.entries[slot][3]
+        if self.keys[slot + 1] == key and self.entries[slot + 1] is not None:
+            return self.entries[slot + 1][3]
+        return None
+
+    def getStats(self):
+        used = sum(entry is not None for entry in self.entries)
+        return {"sizeMB": self.sizeMB, "slots": len(self.entries), "used": used, "probes": self.probes,
+                "hits": self.hits, "hitRate": self.hits / self.probes if self.probes else 0.0, "stores": self.stores,
+                "collisions": self.collisions, "overwrites": self.overwrites}
@@ -0,0 +1,255 @@
+"""
+UCI front end, runs the engine headless under chess GUIs and match runners: python Uci.py
+The main thread reads commands from stdin while the search runs on a thread of its own, so isready, stop and ponderhit
+are answered at once. A running search polls a threading.Event every 1024 nodes and stops within milliseconds.
+Supported: uci, debug, isready, setoption, ucinewgame, position, go (depth, movetime, wtime, btime, winc, binc,
+movestogo, infinite, ponder), stop, ponderhit, quit.
+"""
+
+import sys
+import threading
+import time
+
+import SmartMoveFinder
+import TranspositionTable
+from BitboardEngine import BitboardGameState
+
+ENGINE_NAME = "ChessAI"
+ENGINE_AUTHOR = "Amr Mekki"
+MOVE_OVERHEAD = 0.05  # seconds kept back from every move for the GUI and the pipe
+DEFAULT_MOVES_TO_GO = 30  # moves the remaining clock time is split over when the GUI doesn't say
+
+
+"""
+Seconds to think on a move: a share of the clock time left plus most of the increment, never more than half the clock
+"""
+
+
+def timeBudget(timeLeft, increment=0.0, movesToGo=None):
+    budget = timeLeft / (movesToGo or DEFAULT_MOVES_TO_GO) + increment * 0.8
+    return max(0.01, min(budget, timeLeft / 2) - MOVE_OVERHEAD)
+
+
+"""
+UCI score of a search score, mates as "mate <moves>" with a negative number when the engine gets mated
+"""
+
+
+def uciScore(score):
+    if score >= SmartMoveFinder.MATE_THRESHOLD:
+        return "mate %d" % ((SmartMoveFinder.CHECKMATE - score + 1) // 2)
+    if score <= -SmartMoveFinder.MATE_THRESHOLD:
+        return "mate %d" % -((SmartMoveFinder.CHECKMATE + score) // 2)
+    return "cp %d" % score
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()  # the search thread writes info lines while the main thread answers
+        self.gs = BitboardGameState()
+        self.tt = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_SIZE_MB)
+        self.debug = False
+        self.searchThread = None
+        self.stopEvent = threading.Event()  # stops the search
+        self.answerEvent = threading.Event()  # lets an infinite or ponder search send its bestmove
+        self.search = None
+        self.waitForStop = False  # infinite and ponder searches may not answer before stop or ponderhit
+        self.ponderBudget = None  # time to think on the move once a ponder search gets its ponderhit
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def loop(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line.strip()):
+                break
+        self.stopSearch()
+
+    """
+    Carry out one command, returns False on quit
+    """
+
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max 1024" % SmartMoveFinder.TT_SIZE_MB)
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "debug":
+            self.debug = args[:1] == ["on"]
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(args)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.tt.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.stopSearch()
+            self.go(args)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command == "quit":
+            return False
+        elif self.debug:
+            self.send("info string unknown command " + command)
+        return True
+
+    def setOption(self, args):
+        if "name" not in args:
+            return
+        valueAt = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:valueAt]).lower()
+        value = " ".join(args[valueAt + 1:])
+        if name == "hash":
+            self.tt = TranspositionTable.TranspositionTable(max(1, int(value)))
+        elif name == "bookfile":
+            SmartMoveFinder.loadOpeningBook(value if value and value != "<empty>" else None)
+        elif name == "tablebasepath":
+            SmartMoveFinder.loadTablebases(value if value and value != "<empty>" else None)
+
+    """
+    position startpos [moves e2e4 ...] or position fen <fen> [moves ...]
+    """
+
+    def setPosition(self, args):
+        movesAt = args.index("moves") if "moves" in args else len(args)
+        if args[:1] == ["fen"]:
+            self.gs = BitboardGameState(" ".join(args[1:movesAt]))
+        else:
+            self.gs = BitboardGameState()
+        for notation in args[movesAt + 1:]:
+            move = self.findMove(notation)
+            if move is None:
+                self.send("info string illegal move " + notation)
+                break
+            self.gs.makeMove(move)
+
+    def findMove(self, notation):
+        for move in self.gs.getValidMoves():
+            if move.getChessNotation() == notation.lower():
+                return move
+        return None
+
+    def go(self, args):
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ("infinite", "ponder"):
+                flags.add(args[i])
+                i += 1
+            elif args[i] == "searchmoves":  # moves to search up to the next keyword
+                i += 1
+                options["searchmoves"] = []
+                while i < len(args) and self.findMove(args[i]) is not None:
+                    options["searchmoves"].append(self.findMove(args[i]))
+                    i += 1
+            else:
+                if i + 1 < len(args):
+                    options[args[i]] = args[i + 1]
+                i += 2
+
+        depth = int(options.get("depth", SmartMoveFinder.MAX_PLY))
+        budget = None
+        if "movetime" in options:
+            budget = max(0.01, int(options["movetime"]) / 1000 - MOVE_OVERHEAD)
+        elif "wtime" in options or "btime" in options:
+            side = "w" if self.gs.whiteToMove else "b"
+            timeLeft = int(options.get(side + "time", 0)) / 1000
+            increment = int(options.get(side + "inc", 0)) / 1000
+            movesToGo = int(options["movestogo"]) if "movestogo" in options else None
+            budget = timeBudget(timeLeft, increment, movesToGo)
+        self.waitForStop = "infinite" in flags or "ponder" in flags
+        self.ponderBudget = budget if "ponder" in flags else None
+        timeLimit = None if self.waitForStop else budget
+
+        self.stopEvent = threading.Event()
+        self.answerEvent = threading.Event()
+        self.search = SmartMoveFinder.Search(self.gs, self.tt, timeLimit, self.stopEvent, self.sendInfo)
+        self.searchThread = threading.Thread(target=self.think, args=(self.search, depth,
+                                                                      options.get("searchmoves")), daemon=True)
+        self.searchThread.start()
+
+    """
+    Body of the search thread: book, tablebases, then the search. Answers with bestmove, infinite and ponder searches
+    only once the GUI sent stop or ponderhit.
+    """
+
+    def think(self, search, depth, searchMoves):
+        gs = self.gs
+        validMoves = searchMoves or gs.getValidMoves()
+        result = None
+        if not validMoves:
+            result = SmartMoveFinder.SearchResult(None, 0, [], 0, 0, 0.0)
+        if result is None and searchMoves is None:
+            bookMove = SmartMoveFinder.findBookMove(gs, validMoves)
+            if bookMove is not None:
+                result = SmartMoveFinder.SearchResult(bookMove, 0, [bookMove], 0, 0, 0.0)
+        if result is None and SmartMoveFinder.tablebases is not None:
+            result = SmartMoveFinder.tablebaseRootResult(gs, validMoves)
+            if result is not None:
+                self.sendInfo(result)
+        if result is None:
+            result = search.iterativeDeepening(depth, validMoves)
+        if self.waitForStop:
+            self.answerEvent.wait()
+        self.sendBestMove(result)
+
+    def sendInfo(self, result):
+        nps = int(result.nodes / result.seconds) if result.seconds > 0 else 0
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" %
+                  (result.depth, uciScore(result.score), result.nodes, nps, int(result.seconds * 1000),
+                   " ".join(move.getChessNotation() for move in result.pv)))
+
+    def sendBestMove(self, result):
+        if result.move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove %s ponder %s" % (result.move.getChessNotation(), result.pv[1].getChessNotation()))
+        else:
+            self.send("bestmove " + result.move.getChessNotation())
+
+    """
+    The opponent played the move we pondered on, the ponder search goes on as a normal timed search
+    """
+
+    def ponderHit(self):
+        if self.searchThread is None:
+            return
+        if self.ponderBudget is not None:
+            self.search.deadline = time.perf_counter() + self.ponderBudget
+        self.waitForStop = False
+        self.answerEvent.set()  # a search that already finished answers now
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.waitForStop = False
+            self.stopEvent.set()
+            self.answerEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def main():
+    UciEngine().loop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the engine modules import each other by their plain names, as when a script in ChessAI runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
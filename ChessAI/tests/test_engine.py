@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import ChessEngine
+import Perft
+from BitboardEngine import BitboardGameState
+
+BACKENDS = [ChessEngine.GameState, BitboardGameState]
+
+
+def randomGame(gameState, seed, plies=120):
+    """
+    Yields the game state after every move of a random game
+    """
+    rng = random.Random(seed)
+    for _ in range(plies):
+        moves = gameState.getValidMoves()
+        if not moves:
+            return
+        gameState.makeMove(rng.choice(moves))
+        yield gameState
+
+
+@pytest.mark.parametrize("bitboard", [False, True])
+@pytest.mark.parametrize("name", sorted(Perft.POSITIONS))
+def test_perft(name, bitboard):
+    fen, expected = Perft.POSITIONS[name]
+    for depth in range(1, 4):
+        assert Perft.perft(Perft.newGameState(fen, bitboard), depth) == expected[depth - 1]
+
+
+@pytest.mark.parametrize("fen", [fen for fen, _ in Perft.POSITIONS.values()])
+def test_fen_round_trip(fen):
+    assert ChessEngine.GameState(fen).getFen() == fen
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fen_round_trip_in_games(seed):
+    for gs in randomGame(ChessEngine.GameState(), seed):
+        loaded = ChessEngine.GameState(gs.getFen())
+        assert loaded.getFen() == gs.getFen()
+        assert loaded.zobristKey == gs.zobristKey
+        assert loaded.pawnKey == gs.pawnKey
+        assert loaded.getEvaluation() == gs.getEvaluation()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", range(10))
+def test_incremental_state_matches_recomputed(backend, seed):
+    gs = backend()
+    history = []
+    for gs in randomGame(gs, seed):
+        assert gs.zobristKey == gs.computeZobristKey()
+        assert gs.pawnKey == gs.computePawnKey()
+        assert gs.evaluationLog[-1] == gs.computeEvaluation()
+        history.append((gs.getFen(), gs.zobristKey, gs.pawnKey, gs.evaluationLog[-1]))
+    while gs.moveLog:
+        assert (gs.getFen(), gs.zobristKey, gs.pawnKey, gs.evaluationLog[-1]) == history.pop()
+        gs.undoMove()
+    assert gs.getFen() == ChessEngine.STARTING_FEN
+    assert gs.zobristLog == [gs.computeZobristKey()]
+    assert gs.pawnKeyLog == [gs.computePawnKey()]
+    assert gs.evaluationLog == [gs.computeEvaluation()]
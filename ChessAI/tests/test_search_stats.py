@@ -0,0 +1,31 @@
+import ChessEngine
+import SearchStats
+import TranspositionTable
+from Perft import POSITIONS
+
+
+class CheckCountingSearch(SearchStats.InstrumentedSearch):
+    def __init__(self, gs, tt):
+        super().__init__(gs, tt)
+        self.inCheckQuiescenceNodes = 0
+
+    def quiescence(self, alpha, beta, ply):
+        gs = self.gs
+        if type(gs).kingInCheck(gs):  # the class method, not the timed one on the instance
+            self.inCheckQuiescenceNodes += 1
+        return super().quiescence(alpha, beta, ply)
+
+
+def test_in_check_quiescence_generation_is_timed():
+    gs = ChessEngine.GameState(POSITIONS["kiwipete"][0])
+    search = CheckCountingSearch(gs, TranspositionTable.TranspositionTable(1))
+    search.iterativeDeepening(3)
+    stats = search.stats
+    assert search.inCheckQuiescenceNodes > 0
+    # quiescence calls getLegalMoves at every node in check, the calls from inside the other generators don't count
+    assert stats.calls["getLegalMoves"] == search.inCheckQuiescenceNodes
+    assert stats.methodSeconds["getLegalMoves"] > 0
+    assert stats.calls["getValidCaptures"] > 0
+    assert stats.calls["scoreBoard"] == stats.quiescenceNodes
+    for name in SearchStats.TIMED_METHODS:  # the timers are taken off again
+        assert name not in vars(gs)